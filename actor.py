@@ -1,7 +1,11 @@
 """haakon8855"""
 
-import random
-from collections import defaultdict
+import numpy as np
+
+from eligibility import (BatchEligibilityTraces, EligibilityTraces,
+                         LazyEligibilityTraces)
+from state_index import StateIndex
+from random_streams import RandomStream
 
 
 class Actor:
@@ -9,86 +13,238 @@ class Actor:
     Actor class for making actions in a simulated world.
     """
 
-    def __init__(self, lrate, drate, trace_decay):
-        self.policy = defaultdict(lambda: 0)
-        self.state_action_eligibility = defaultdict(lambda: 0)
+    def __init__(self,
+                 lrate,
+                 drate,
+                 trace_decay,
+                 num_actions,
+                 lazy_traces=False,
+                 state_index=None,
+                 rng=None):
         self.lrate = lrate
         self.drate = drate
         self.trace_decay = trace_decay
+        # Stream drawing the random actions and breaking ties
+        self.rng = rng if rng is not None else RandomStream()
+        # The policy is a table of state-action values indexed by state ID
+        # and action, where actions are integers in range(num_actions).
+        self.num_actions = num_actions
+        self.state_index = state_index
+        if self.state_index is None:
+            self.state_index = StateIndex()
+        self.policy = np.zeros((self.state_index.capacity, num_actions))
+        self.state_index.add_listener(self.grow_policy)
+        traces = EligibilityTraces
+        if lazy_traces:
+            traces = LazyEligibilityTraces
+        self.state_action_eligibility = traces(self.policy.reshape(-1), lrate,
+                                               drate * trace_decay)
+        # Traces of the sim worlds of a vector sim world in batched training
+        self.batch_eligibility = BatchEligibilityTraces(
+            self.policy.reshape(-1), lrate, drate * trace_decay)
+
+    def grow_policy(self, capacity):
+        """
+        Grows the policy table to hold the given number of states.
+        """
+        self.policy = StateIndex.resize_table(self.policy, capacity, 0)
+        self.state_action_eligibility.table = self.policy.reshape(-1)
+        self.batch_eligibility.table = self.policy.reshape(-1)
+
+    def use_policy(self, policy):
+        """
+        Makes the given array, e.g. one in shared memory, the policy table.
+        It must have a row for every state.
+        """
+        self.policy = policy
+        self.state_action_eligibility.table = self.policy.reshape(-1)
+        self.batch_eligibility.table = self.policy.reshape(-1)
 
     def initiate_eligibility(self):
         """
         Initiates the state-action eligibility.
         """
-        self.state_action_eligibility = defaultdict(lambda: 0)
+        self.state_action_eligibility.reset()
 
-    def get_state_action_eligibility(self, state_action_pair):
+    def get_state_action_eligibility(self, state_id, action):
         """
-        Updates the eligibility for the given state_action_pair.
+        Returns the eligibility for the given state and action.
         """
-        return self.state_action_eligibility[state_action_pair]
+        return self.state_action_eligibility.get_trace(
+            state_id * self.num_actions + action)
 
-    def set_state_action_eligibility(self, state_action_pair, value):
+    def visit_state_action(self, state_id, action):
         """
-        Updates the eligibility for the given state_action_pair.
+        Sets the eligibility for the given state and action to 1.
         """
-        self.state_action_eligibility[state_action_pair] = value
+        self.state_action_eligibility.visit(state_id * self.num_actions +
+                                            action)
 
-    def get_state_action_value(self, state_action_pair):
+    def get_state_action_value(self, state_id, action):
         """
         Returns the value of the state and action pair.
         """
-        return self.policy[state_action_pair]
+        return self.state_action_eligibility.get_value(
+            state_id * self.num_actions + action)
 
-    def set_state_action_value(self, state_action_pair, value):
+    def update_state_action_values(self, td_error):
         """
-        Returns the value of the state and action pair.
+        Updates the state action evaluation of every state action pair visited
+        so far in the episode given the td_error, and decays their
+        eligibilities.
+        """
+        self.state_action_eligibility.update(td_error)
+
+    def get_state_action_values(self, state_id):
+        """
+        Returns the value of every action in the given state.
+        """
+        start = state_id * self.num_actions
+        return self.state_action_eligibility.get_value_range(
+            start, start + self.num_actions)
+
+    def get_proposed_action(self, do_argmax, state_id, legal_mask):
+        """
+        Returns the proposed action given a state and a boolean array
+        marking its legal actions. A parameter 'do_argmax' is also specified
+        denoting whether the actor should return the action with greatest
+        value or a random action. Ties are broken at random.
+        """
+        return Actor.choose_action(do_argmax,
+                                   self.get_state_action_values(state_id),
+                                   legal_mask, self.rng)
+
+    @staticmethod
+    def choose_action(do_argmax, state_action_values, legal_mask, rng):
+        """
+        Returns a random legal action, or if 'do_argmax' is True, a random
+        one of the legal actions with the greatest value, drawn from the
+        RandomStream 'rng'.
+        """
+        legal_actions = np.flatnonzero(legal_mask)
+        if do_argmax:
+            legal_values = state_action_values[legal_actions]
+            legal_actions = legal_actions[legal_values == legal_values.max()]
+            if len(legal_actions) == 1:
+                return int(legal_actions[0])
+        return int(legal_actions[rng.integers(0, len(legal_actions))])
+
+    def get_proposed_actions(self, do_argmax, state_ids, legal_masks):
+        """
+        Batched get_proposed_action: returns the proposed action of each sim
+        world given arrays of its state ID, whether to take the greedy action
+        and its legal-action mask.
+        """
+        return Actor.choose_actions(do_argmax, self.policy[state_ids],
+                                    legal_masks, self.rng)
+
+    @staticmethod
+    def choose_actions(do_argmax, state_action_values, legal_masks, rng):
+        """
+        Batched choose_action, given one row of values and legal-action mask
+        per sim world. Picks a random legal action in each row, or a random
+        one of the legal actions with the greatest value where 'do_argmax'
+        is True.
+        """
+        values = np.where(legal_masks, state_action_values, -np.inf)
+        candidates = legal_masks.copy()
+        greedy = values == values.max(axis=1, keepdims=True)
+        candidates[do_argmax] = greedy[do_argmax]
+        # The candidate with the greatest uniform noise is a random one
+        noise = rng.generator.random(candidates.shape)
+        return np.argmax(np.where(candidates, noise, -1), axis=1)
+
+    def visit_state_actions(self, state_ids, actions):
+        """
+        Sets the eligibility of the given state and action of each sim world
+        to 1 in batched training.
+        """
+        self.batch_eligibility.visit(state_ids * self.num_actions + actions)
+
+    def update_batch_state_action_values(self, td_errors):
+        """
+        Updates the state action evaluation of every state action pair
+        visited in the current episodes of the sim worlds in batched
+        training, given the TD-error of each sim world, and decays their
+        eligibilities.
+        """
+        self.batch_eligibility.update(td_errors)
+
+    def reset_batch_eligibility(self, dones):
+        """
+        Clears the eligibilities of the sim worlds marked in the boolean
+        array 'dones' in batched training.
+        """
+        self.batch_eligibility.reset(dones)
+
+
+class LinearActor:
+    """
+    Actor whose preference for an action in a state is the sum of the
+    weights of the state's active features for that action, e.g. from a
+    TileCoder. States are given as arrays of active feature indexes.
+    """
+
+    def __init__(self,
+                 num_features,
+                 num_active,
+                 lrate,
+                 drate,
+                 trace_decay,
+                 num_actions,
+                 lazy_traces=False,
+                 rng=None):
+        # One weight per feature and action, indexed by
+        # feature * num_actions + action
+        self.num_actions = num_actions
+        self.rng = rng if rng is not None else RandomStream()
+        self.policy = np.zeros((num_features, num_actions))
+        traces = EligibilityTraces
+        if lazy_traces:
+            traces = LazyEligibilityTraces
+        self.state_action_eligibility = traces(self.policy.reshape(-1),
+                                               lrate / num_active,
+                                               drate * trace_decay)
+
+    def initiate_eligibility(self):
+        """
+        Initiates the feature-action eligibility.
+        """
+        self.state_action_eligibility.reset()
+
+    def visit_state_action(self, features, action):
+        """
+        Sets the eligibility of each of the given active features and the
+        action to 1.
+        """
+        self.state_action_eligibility.visit_keys(features * self.num_actions +
+                                                 action)
+
+    def get_state_action_values(self, features):
+        """
+        Returns the preference for every action in the state with the given
+        active features.
+        """
+        keys = features[:, None] * self.num_actions + np.arange(
+            self.num_actions)
+        return self.state_action_eligibility.get_values(
+            keys.reshape(-1)).reshape(keys.shape).sum(axis=0)
+
+    def update_state_action_values(self, td_error):
+        """
+        Updates the weight of every feature-action pair visited so far in the
+        episode given the td_error, and decays their eligibilities.
+        """
+        self.state_action_eligibility.update(td_error)
+
+    def get_proposed_action(self, do_argmax, features, legal_mask):
+        """
+        Returns the proposed action given the active features of a state and
+        a boolean array marking its legal actions, as in
+        Actor.get_proposed_action.
         """
-        self.policy[state_action_pair] = value
-
-    def update_state_action_value(self, state_action_pair, td_error):
-        """
-        Updates the state action evaluation given a state action pair
-        and td_error.
-        """
-        # Calculate the new policy value
-        new_state_action_value = self.get_state_action_value(
-            state_action_pair
-        ) + self.lrate * td_error * self.get_state_action_eligibility(
-            state_action_pair)
-        # Store it in the policy table
-        self.set_state_action_value(state_action_pair, new_state_action_value)
-
-    def update_state_action_eligibility(self, state_action_pair):
-        """
-        Updates the state action eligibility given a state action pair.
-        """
-        # Calculate the new eligibility value
-        new_state_action_eligibility = (
-            self.drate * self.trace_decay *
-            self.get_state_action_eligibility(state_action_pair))
-        # Store it in the eligibility table
-        self.set_state_action_eligibility(state_action_pair,
-                                          new_state_action_eligibility)
-
-    def get_proposed_action(self, do_argmax, state, possible_actions):
-        """
-        Returns the proposed action given a state and its possible actions.
-        A parameter 'do_argmax' is also specified denoting whether the actor
-        should return the action with greatest value or a random action.
-        """
-        if not do_argmax:
-            # Return random action
-            return random.choice(possible_actions)
-        # Else, return the action with the best policy value
-        best_action = []
-        best_state_action_value = float('-inf')
-        for action in possible_actions:
-            state_action_pair = (*state, action)
-            state_action_value = self.get_state_action_value(state_action_pair)
-            if state_action_value > best_state_action_value:
-                best_action = [action]
-                best_state_action_value = state_action_value
-            elif best_state_action_value == state_action_value:
-                best_action.append(action)
-        return random.choice(best_action)
+        state_action_values = None
+        if do_argmax:
+            state_action_values = self.get_state_action_values(features)
+        return Actor.choose_action(do_argmax, state_action_values, legal_mask,
+                                   self.rng)
@@ -0,0 +1,275 @@
+"""haakon8855"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from time import perf_counter, time
+import numpy as np
+
+from instrumentation import PhaseTimers
+
+
+class Benchmark:
+    """
+    Trains every given config headless for a fixed number of episodes and
+    measures throughput, where the time goes and peak memory. Each config
+    runs in a fresh process so that peak memory is measured per config.
+    """
+
+    def __init__(self, config_files, episodes=100, seed=0, critics=False):
+        self.config_files = config_files
+        self.episodes = episodes
+        self.seed = seed
+        self.critics = critics
+
+    def run(self, output='benchmark_results.json'):
+        """
+        Benchmarks every config, and the latency of every critic backend if
+        specified, and writes the results to a json-file.
+        """
+        results = []
+        for config_file in self.config_files:
+            result = Benchmark.run_isolated(os.path.basename(config_file),
+                                            benchmark_config, config_file,
+                                            self.episodes, self.seed)
+            results.append(result)
+            Benchmark.print_result(result)
+        critic_results = []
+        if self.critics:
+            # Imported here so that the benchmark itself never loads
+            # TensorFlow
+            # pylint: disable=import-outside-toplevel
+            from critic import Critic
+            for backend in Critic.backends:
+                result = Benchmark.run_isolated(backend,
+                                                benchmark_critic_backend,
+                                                backend, self.seed)
+                critic_results.append(result)
+                Benchmark.print_critic_result(result)
+        report = {
+            'time': time(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'episodes': self.episodes,
+            'seed': self.seed,
+            'results': results,
+            'critic_results': critic_results,
+        }
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        return report
+
+    @staticmethod
+    def run_isolated(name, function, *args):
+        """
+        Calls the function with the given arguments in a fresh process and
+        returns its result, or a result holding the error if it fails.
+        """
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=context) as executor:
+            future = executor.submit(function, *args)
+            try:
+                return future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                # E.g. TensorFlow missing for the NN based configs
+                return {
+                    'config': name,
+                    'error': f"{type(error).__name__}: {error}"
+                }
+
+    @staticmethod
+    def print_critic_result(result):
+        """
+        Prints a one-line summary of the latency of one critic backend.
+        """
+        if 'error' in result:
+            print(f"{result['config']}: {result['error']}")
+            return
+        print(f"{result['config']}: "
+              f"{round(result['td_error_usecs'], 1)} us per TD-error, "
+              f"{round(result['update_usecs_per_step'], 1)} us per step "
+              "updating")
+
+    @staticmethod
+    def print_result(result):
+        """
+        Prints a one-line summary of the result of one config.
+        """
+        if 'error' in result:
+            print(f"{result['config']}: {result['error']}")
+            return
+        print(f"{result['config']}: "
+              f"{round(result['steps_per_sec'])} steps/s, "
+              f"{round(result['episodes_per_sec'], 1)} episodes/s, "
+              f"{round(result['peak_memory_mb'])} MB")
+
+
+def benchmark_config(config_file, episodes, seed):
+    """
+    Trains on the given config for the given number of episodes and returns
+    the measurements.
+    """
+    result = {'config': os.path.basename(config_file)}
+    # Imported here so that import time is part of each measurement
+    start_time = perf_counter()
+    # pylint: disable=import-outside-toplevel
+    from gprl_system import GPRLSystem
+    from gambler import GamblerSolver
+    overrides = {'episodes': episodes, 'seed': seed, 'verbose': 'false'}
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with redirect_stdout(devnull):
+            gprl = GPRLSystem(config_file, overrides, visualize=False)
+            # A second system with the same seed plays the same episodes
+            # with the phases timed, so that the timers do not slow down the
+            # run whose throughput is measured
+            timed_gprl = GPRLSystem(config_file, overrides, visualize=False)
+    result['startup_secs'] = perf_counter() - start_time
+    learner = gprl.reinforcement_learner
+    sim_world = gprl.sim_world
+    seconds = train_episodes(learner, episodes)
+
+    # Wrap the hot-loop methods on the instances to time each phase
+    timers = PhaseTimers()
+    timers.attach(timed_gprl.reinforcement_learner)
+    timed_seconds = train_episodes(timed_gprl.reinforcement_learner,
+                                   episodes)
+
+    steps = int(sim_world.historic_game_length.total)
+    report = timers.get_report()
+    phase_secs = {phase: stats['secs'] for phase, stats in report.items()}
+    phase_calls = {phase: stats['calls'] for phase, stats in report.items()}
+    result.update({
+        'episodes': episodes,
+        'steps': steps,
+        'seconds': seconds,
+        'steps_per_sec': steps / seconds,
+        'episodes_per_sec': episodes / seconds,
+        'phase_secs': phase_secs,
+        'phase_calls': phase_calls,
+        'other_secs': timed_seconds - sum(phase_secs.values()),
+        'mean_game_length': steps / episodes,
+        # Linux reports the peak resident set size in kilobytes
+        'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss /
+                          1024,
+    })
+    if gprl.problem == 'gambler':
+        # Fraction of states where the greedy wager is optimal
+        solver = GamblerSolver(sim_world.win_prob, sim_world.max_coins,
+                               gprl.drate)
+        optimal_actions = solver.get_optimal_actions()
+        learner.epsilon = 0
+        optimal = [
+            optimal_actions[coins,
+                            learner.get_action(sim_world.one_hot_state(coins))]
+            for coins in range(1, sim_world.max_coins)
+        ]
+        result['optimal_policy_fraction'] = float(np.mean(optimal))
+    return result
+
+
+def train_episodes(learner, episodes):
+    """
+    Trains the learner for the given number of episodes without any
+    reporting, and returns the seconds taken.
+    """
+    train_episode = learner.one_episode
+    if learner.tile_coder is not None:
+        train_episode = learner.one_episode_linear
+    elif not learner.table_critic:
+        train_episode = learner.one_episode_nn
+    start_time = perf_counter()
+    for episode in range(episodes):
+        train_episode()
+        learner.sim_world.store_game_length()
+        if learner.is_epsilon_episode(episode):
+            learner.decrease_epsilon()
+    return perf_counter() - start_time
+
+
+def benchmark_critic_backend(backend,
+                             seed,
+                             state_length=20,
+                             episode_length=300,
+                             episodes=10):
+    """
+    Measures the latency of one critic backend on random one-hot states:
+    microseconds per call to get_td_error, and microseconds per step spent
+    updating state values, either through the eligibility traces for the
+    table or by training on the episode afterwards for networks.
+    """
+    # pylint: disable=import-outside-toplevel
+    from critic import Critic
+    from state_index import StateIndex
+    state_index = StateIndex()
+    critic = Critic(backend == 'table',
+                    0.01,
+                    0.99,
+                    0.5,
+                    seed,
+                    state_index=state_index,
+                    backend=backend)
+    rng = np.random.default_rng(seed)
+    states = rng.integers(0, 2, (episode_length + 1, state_length))
+    # The table based critic looks states up by ID
+    keys = [tuple(state) for state in states]
+    if critic.table_critic:
+        keys = [state_index.get_id(key) for key in keys]
+    td_error_time = 0
+    update_time = 0
+    for _ in range(episodes):
+        critic.initiate_eligibility()
+        targets = []
+        for step in range(episode_length):
+            start_time = perf_counter()
+            _, target = critic.get_td_error(1, keys[step], keys[step + 1])
+            td_error_time += perf_counter() - start_time
+            targets.append(target)
+            start_time = perf_counter()
+            if critic.table_critic:
+                critic.visit_state(keys[step])
+                critic.update_traced_state_values(1)
+            update_time += perf_counter() - start_time
+        if not critic.table_critic:
+            start_time = perf_counter()
+            critic.update_state_values(states[:-1], np.array(targets))
+            update_time += perf_counter() - start_time
+    steps = episodes * episode_length
+    return {
+        'config': backend,
+        'td_error_usecs': td_error_time / steps * 1e6,
+        'update_usecs_per_step': update_time / steps * 1e6,
+    }
+
+
+def main():
+    """
+    Main function for running the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=Benchmark.__doc__)
+    parser.add_argument('configs', nargs='*',
+                        help='config files, default all in configs/')
+    parser.add_argument('--episodes', type=int, default=100,
+                        help='number of episodes to train for per config')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the RNG')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='json-file to write the results to')
+    parser.add_argument('--critics', action='store_true',
+                        help='also compare the latency of the critic backends')
+    args = parser.parse_args()
+    configs = args.configs
+    if not configs:
+        configs = sorted(glob.glob('configs/config_*.ini'))
+    Benchmark(configs, args.episodes, args.seed,
+              args.critics).run(args.output)
+
+
+if __name__ == "__main__":
+    main()
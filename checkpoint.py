@@ -0,0 +1,32 @@
+"""haakon8855"""
+
+import os
+import numpy as np
+
+
+class Checkpoint:
+    """
+    Stores named NumPy arrays in an uncompressed .npz-file, which loads
+    without unpickling anything.
+    """
+
+    @staticmethod
+    def save(path, arrays):
+        """
+        Writes the given dict of arrays to 'path'. The file is written next
+        to it first and then moved into place, so a run dying mid-save
+        leaves the previous checkpoint intact.
+        """
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path):
+        """
+        Reads the arrays from the checkpoint at 'path' and returns them as a
+        dict.
+        """
+        with np.load(path, allow_pickle=False) as checkpoint:
+            return dict(checkpoint)
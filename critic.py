@@ -1,28 +1,69 @@
 """haakon8855"""
 
-from collections import defaultdict
-from random import random
-from tensorflow import keras as ks
+import importlib
 import numpy as np
 
+from eligibility import (BatchEligibilityTraces, EligibilityTraces,
+                         LazyEligibilityTraces)
+from state_index import StateIndex
+from random_streams import RandomStream
+
 
 class Critic:
     """
     Critic class for housing the critic which will give feedback to the actor
     on its actions.
+
+    The critic's state values come from one of the backends registered in
+    'backends': a table, or a neural network given by the module and class
+    name implementing it. Network modules are only imported when used.
     """
 
+    backends = {
+        'table': None,
+        'keras': ('keras_critic', 'KerasStateValueNetwork'),
+        'numpy_mlp': ('numpy_critic', 'NumpyStateValueNetwork'),
+    }
+
     def __init__(self,
                  table_critic,
                  lrate,
                  drate,
                  trace_decay,
                  seed=None,
-                 nn_dims=None):
-        self.state_value = defaultdict(Critic.default_state_value)
-        self.state_eligibility = defaultdict(lambda: 0)
-        self.table_critic = table_critic
+                 nn_dims=None,
+                 lazy_traces=False,
+                 state_index=None,
+                 nn_epochs=10,
+                 nn_batch_size=32,
+                 backend=None,
+                 rng=None):
+        # The table of state values is indexed by state ID. States that have
+        # not been accessed yet are NaN until given their default value.
+        self.state_index = state_index
+        if self.state_index is None:
+            self.state_index = StateIndex()
+        self.state_value = np.full(self.state_index.capacity, np.nan)
+        self.state_index.add_listener(self.grow_state_value)
+        traces = EligibilityTraces
+        if lazy_traces:
+            traces = LazyEligibilityTraces
+        self.state_eligibility = traces(self.state_value, lrate,
+                                        drate * trace_decay)
+        # Traces of the sim worlds of a vector sim world in batched training
+        self.batch_eligibility = BatchEligibilityTraces(
+            self.state_value, lrate, drate * trace_decay)
+        # Without a backend given, 'table_critic' chooses between a table
+        # and a Keras network
+        self.backend = backend
+        if self.backend is None:
+            self.backend = 'table' if table_critic else 'keras'
+        if self.backend not in Critic.backends:
+            raise Exception(f"Unknown critic backend '{self.backend}'")
+        self.table_critic = self.backend == 'table'
         self.state_value_nn = None
+        self.nn_epochs = nn_epochs
+        self.nn_batch_size = nn_batch_size
         self.lrate = lrate
         self.drate = drate
         self.trace_decay = trace_decay
@@ -32,101 +73,267 @@ class Critic:
         if self.nn_dims is None:
             self.nn_dims = [50, 1]
 
-        # Seed the RNG if seed is specified
-        if seed is not None:
-            ks.utils.set_random_seed(seed)
+        # Stream drawing the default values of the table's states
+        self.rng = rng if rng is not None else RandomStream(seed)
 
-        # Initiate the neural network if the critic is not table-based
-        if not table_critic:
-            self.init_neural_network()
+        # Initiate the neural network if the critic is not table-based. The
+        # network draws from its own stream spawned from 'rng'.
+        self.nn_rng = None
+        if not self.table_critic:
+            module_name, class_name = Critic.backends[self.backend]
+            network = getattr(importlib.import_module(module_name),
+                              class_name)
+            self.nn_rng = self.rng.spawn(1)[0]
+            self.state_value_nn = network(self.nn_dims,
+                                          lrate,
+                                          seed,
+                                          nn_batch_size,
+                                          rng=self.nn_rng.generator)
 
-    def init_neural_network(self):
+    def grow_state_value(self, capacity):
         """
-        Initializes the neural network.
+        Grows the state value table to hold the given number of states.
         """
-        opt = ks.optimizers.Adam  # NN optimizer
-        model = ks.models.Sequential()  # Init base model
+        self.state_value = StateIndex.resize_table(self.state_value, capacity,
+                                                   np.nan)
+        self.state_eligibility.table = self.state_value
+        self.batch_eligibility.table = self.state_value
 
-        # Populate layers
-        for nodes in self.nn_dims[:-1]:
-            model.add(ks.layers.Dense(nodes, activation='tanh'))
-        model.add(ks.layers.Dense(self.nn_dims[-1]))  # Output layer
-        model.compile(optimizer=opt(learning_rate=self.lrate), loss='mse')
-        # Store model reference
-        self.state_value_nn = model
+    def use_state_value(self, state_value):
+        """
+        Only for table based critic:
+        Makes the given array, e.g. one in shared memory, the state value
+        table. It must have an entry for every state.
+        """
+        self.state_value = state_value
+        self.state_eligibility.table = self.state_value
+        self.batch_eligibility.table = self.state_value
 
     def get_td_error(self, reward, state, new_state):
         """
         Returns the td_error given a reward, a state and the next state.
         """
+        if not self.table_critic:
+            # Evaluate both states in one forward pass
+            value, new_value = self.get_state_values((state, new_state))
+            target_td = reward + self.drate * new_value
+            return target_td - value, target_td
         target_td = reward + self.drate * self.get_state_value(new_state)
         return target_td - self.get_state_value(state), target_td
 
     def get_state_value(self, state):
         """
-        Returns the value of a given state.
+        Returns the value of a given state. The state is given by its ID for
+        the table based critic and by its encoding for the NN based critic.
         """
         # Use table or neural net depending on config parameter
         if self.table_critic:
-            return self.state_value[state]
-        return self.state_value_nn(np.array(state).reshape((1, -1)))[0, 0]
+            value = self.state_eligibility.get_value(state)
+            if value != value:
+                # NaN, first access to this state
+                value = Critic.default_state_value(self.rng)
+                self.state_value[state] = value
+            return value
+        return self.get_state_values((state, ))[0]
+
+    def get_td_errors(self, rewards, state_ids, new_state_ids):
+        """
+        Only for table based critic:
+        Batched get_td_error, given arrays of the reward, state ID and next
+        state ID of each sim world.
+        """
+        new_values = self.get_table_state_values(new_state_ids)
+        return (rewards + self.drate * new_values -
+                self.get_table_state_values(state_ids))
 
-    def set_state_value(self, state, value):
+    def get_table_state_values(self, state_ids):
         """
-        Returns the value of a given state.
+        Only for table based critic:
+        Returns the values of the states with the given IDs, giving states
+        that have not been accessed yet their default value.
         """
-        self.state_value[state] = value
+        values = self.state_value[state_ids]
+        unseen = np.isnan(values)
+        if unseen.any():
+            self.state_value[state_ids[unseen]] = (
+                Critic.default_state_values(self.rng,
+                                            np.count_nonzero(unseen)))
+            # Read again, as a state may occur more than once
+            values = self.state_value[state_ids]
+        return values
+
+    def get_state_values(self, states):
+        """
+        Only for NN based critic:
+        Returns the values of a block of states, given one state per row, in
+        one forward pass through the neural network.
+        """
+        return self.state_value_nn.get_state_values(states)
+
+    def get_weights(self):
+        """
+        Only for NN based critic:
+        Returns a flat list of the kernel and bias of each layer of the
+        neural network.
+        """
+        return [
+            weight for layer in self.state_value_nn.weights for weight in layer
+        ]
+
+    def set_weights(self, weights):
+        """
+        Only for NN based critic:
+        Sets the weights of the neural network from a flat list of the kernel
+        and bias of each layer.
+        """
+        self.state_value_nn.set_weights(weights)
 
     def get_state_eligibility(self, state):
         """
-        Set the eligibility for the given state.
+        Returns the eligibility for the given state.
         """
-        return self.state_eligibility[state]
+        return self.state_eligibility.get_trace(state)
 
-    def set_state_eligibility(self, state, value):
+    def visit_state(self, state):
         """
-        Set the eligibility for the given state.
+        Only for table based critic:
+        Sets the eligibility for the given state to 1.
         """
-        self.state_eligibility[state] = value
+        self.state_eligibility.visit(state)
+
+    def visit_states(self, state_ids):
+        """
+        Only for table based critic:
+        Sets the eligibility of the state of each sim world to 1 in batched
+        training.
+        """
+        self.batch_eligibility.visit(state_ids)
+
+    def update_batch_state_values(self, td_errors):
+        """
+        Only for table based critic:
+        Updates the state evaluation of every state visited in the current
+        episodes of the sim worlds in batched training, given the TD-error
+        of each sim world, and decays their eligibilities.
+        """
+        self.batch_eligibility.update(td_errors)
+
+    def reset_batch_eligibility(self, dones):
+        """
+        Only for table based critic:
+        Clears the eligibilities of the sim worlds marked in the boolean
+        array 'dones' in batched training.
+        """
+        self.batch_eligibility.reset(dones)
 
     def initiate_eligibility(self):
         """
         Initiates the state eligibility.
         """
-        self.state_eligibility = defaultdict(lambda: 0)
+        self.state_eligibility.reset()
 
-    def update_state_value(self, state, td_error):
+    def update_traced_state_values(self, td_error):
         """
         Only for table based critic:
-        Update the state evaluation given the current state and td_error.
+        Update the state evaluation of every state visited so far in the
+        episode given the td_error, and decays their eligibilities.
         """
-        # Calculates the new state-value
-        new_state_value = self.get_state_value(
-            state) + self.lrate * td_error * self.get_state_eligibility(state)
-        # Stores it in the table
-        self.set_state_value(state, new_state_value)
+        self.state_eligibility.update(td_error)
 
     def update_state_values(self, states, targets):
         """
         Only for NN based critic:
         Update the state evaluations given a list of states and td_error.
+        Trains for self.nn_epochs epochs over shuffled mini-batches.
         """
-        self.state_value_nn.fit(states, targets, epochs=10, verbose=0)
+        self.state_value_nn.reset_timers()
+        self.state_value_nn.train(states, targets, self.nn_epochs)
 
-    def update_state_eligibility(self, state):
+    def train_from_replay(self, replay_buffer, num_batches):
         """
-        Only for table based critic:
-        Update the state eligibility given the current state.
+        Only for NN based critic:
+        Trains on 'num_batches' mini-batches sampled from the replay buffer.
+        Targets are recomputed with the current network for every batch.
         """
-        if self.table_critic:
-            new_state_eligibility = (self.drate * self.trace_decay *
-                                     self.get_state_eligibility(state))
-            self.set_state_eligibility(state, new_state_eligibility)
+        self.state_value_nn.reset_timers()
+        for _ in range(num_batches):
+            states, rewards, next_states, dones = replay_buffer.sample(
+                self.nn_batch_size)
+            # Final states have a value of 0
+            targets = rewards + self.drate * self.get_state_values(
+                next_states) * ~dones
+            self.state_value_nn.train(states, targets, 1)
 
     @staticmethod
-    def default_state_value():
+    def default_state_value(rng):
+        """
+        Returns the default value of a state that has not been accessed yet,
+        drawn from the RandomStream 'rng'.
+        """
+        return rng.random() * 0.5
+
+    @staticmethod
+    def default_state_values(rng, count):
+        """
+        Returns an array of 'count' default state values.
+        """
+        return rng.generator.random(count) * 0.5
+
+
+class LinearCritic:
+    """
+    Critic estimating the value of a state as the sum of the weights of its
+    active features, e.g. from a TileCoder. States are given as arrays of
+    active feature indexes, so each visit and lookup touches only as many
+    weights as there are active features.
+    """
+
+    def __init__(self,
+                 num_features,
+                 num_active,
+                 lrate,
+                 drate,
+                 trace_decay,
+                 lazy_traces=False):
+        self.weights = np.zeros(num_features)
+        self.drate = drate
+        traces = EligibilityTraces
+        if lazy_traces:
+            traces = LazyEligibilityTraces
+        # The learning rate is shared between the active features, so that a
+        # visit moves the state value as far as a visit to a table cell
+        self.state_eligibility = traces(self.weights, lrate / num_active,
+                                        drate * trace_decay)
+
+    def get_td_error(self, reward, features, new_features):
+        """
+        Returns the td_error given a reward, the active features of a state
+        and those of the next state.
+        """
+        target_td = reward + self.drate * self.get_state_value(new_features)
+        return target_td - self.get_state_value(features), target_td
+
+    def get_state_value(self, features):
+        """
+        Returns the value of the state with the given active features.
+        """
+        return self.state_eligibility.get_values(features).sum()
+
+    def visit_state(self, features):
+        """
+        Sets the eligibility of each of the given active features to 1.
+        """
+        self.state_eligibility.visit_keys(features)
+
+    def initiate_eligibility(self):
+        """
+        Initiates the feature eligibility.
+        """
+        self.state_eligibility.reset()
+
+    def update_traced_state_values(self, td_error):
         """
-        Returns the default value of a dictionary object that has not been
-        accessed yet.
+        Updates the weight of every feature visited so far in the episode
+        given the td_error, and decays their eligibilities.
         """
-        return random() * 0.5
+        self.state_eligibility.update(td_error)
@@ -0,0 +1,398 @@
+"""haakon8855"""
+
+import numpy as np
+
+
+class EligibilityTraces:
+    """
+    Eligibility traces over the distinct keys visited during an episode.
+
+    Keys are integer indexes into a flat NumPy table of values. The traces of
+    the visited keys are held in arrays, so decaying the traces and applying
+    a TD-error to all of them is a single vectorized operation per step. A
+    key visited several times in one episode gets the same total update as
+    replaying every occurrence in the episode history one at a time.
+    """
+
+    def __init__(self, table, lrate, decay, capacity=64):
+        self.table = table
+        self.lrate = lrate
+        self.decay = decay
+        self.index = {}
+        self.size = 0
+        self.keys = np.zeros(capacity, dtype=int)
+        self.traces = np.zeros(capacity)
+        # Decay and accumulated gain per step for a key occurring 'count'
+        # times in the history: decay**count and sum(decay**i, i < count)
+        self.decay_pow = np.ones(capacity)
+        self.gain = np.zeros(capacity)
+
+    def reset(self):
+        """
+        Clears all traces.
+        """
+        self.index = {}
+        self.size = 0
+
+    def visit(self, key):
+        """
+        Sets the trace of the given key to 1, counting one more occurrence
+        of the key in the episode history.
+        """
+        slot = self.get_slot(key)
+        self.traces[slot] = 1
+        self.gain[slot] += self.decay_pow[slot]
+        self.decay_pow[slot] *= self.decay
+
+    def visit_keys(self, keys):
+        """
+        Visits each key in the given array of distinct keys.
+        """
+        slots = np.array([self.get_slot(key) for key in keys.tolist()])
+        self.traces[slots] = 1
+        self.gain[slots] += self.decay_pow[slots]
+        self.decay_pow[slots] *= self.decay
+
+    def update(self, td_error):
+        """
+        Updates the values of all visited keys given the td_error, and decays
+        their traces.
+        """
+        size = self.size
+        self.table[self.keys[:size]] += (self.lrate * td_error *
+                                         self.traces[:size] *
+                                         self.gain[:size])
+        self.traces[:size] *= self.decay_pow[:size]
+
+    def get_value(self, key):
+        """
+        Returns the value of the given key.
+        """
+        return self.table[key]
+
+    def get_values(self, keys):
+        """
+        Returns the values of the given array of keys.
+        """
+        return self.table[keys]
+
+    def get_value_range(self, start, stop):
+        """
+        Returns the values of the keys in range(start, stop).
+        """
+        return self.table[start:stop]
+
+    def get_trace(self, key):
+        """
+        Returns the trace of the given key.
+        """
+        slot = self.index.get(key)
+        if slot is None:
+            return 0
+        return self.traces[slot]
+
+    def get_slot(self, key):
+        """
+        Returns the array slot of the given key, allocating one if the key
+        has not been visited yet.
+        """
+        slot = self.index.get(key)
+        if slot is not None:
+            return slot
+        if self.size == len(self.keys):
+            self.grow()
+        slot = self.size
+        self.size += 1
+        self.index[key] = slot
+        self.keys[slot] = key
+        self.traces[slot] = 0
+        self.decay_pow[slot] = 1
+        self.gain[slot] = 0
+        return slot
+
+    def grow(self):
+        """
+        Doubles the capacity of the arrays.
+        """
+        capacity = 2 * len(self.keys)
+        self.keys = np.resize(self.keys, capacity)
+        self.traces = np.resize(self.traces, capacity)
+        self.decay_pow = np.resize(self.decay_pow, capacity)
+        self.gain = np.resize(self.gain, capacity)
+
+
+class LazyEligibilityTraces(EligibilityTraces):
+    """
+    Replacing eligibility traces with a lazily applied global decay factor.
+
+    Every trace is stored relative to a shared scale, so decaying all traces
+    and applying a TD-error costs O(1) per step regardless of how many keys
+    have been visited. Values in the table are brought up to date only when
+    a key is revisited, when the scale is renormalized or when the traces are
+    reset; get_value accounts for the pending updates. Keys whose trace has
+    decayed below 'min_trace' are dropped on renormalization. Unlike
+    EligibilityTraces, a key's trace decays once per step no matter how many
+    times it occurs in the episode history.
+    """
+
+    def __init__(self,
+                 table,
+                 lrate,
+                 decay,
+                 capacity=64,
+                 min_scale=1e-8,
+                 min_trace=1e-12):
+        super().__init__(table, lrate, decay, capacity)
+        self.min_scale = min_scale
+        self.min_trace = min_trace
+        self.scale = 1.0
+        # Running sum of td_error * scale, and its value when each key was
+        # last brought up to date.
+        self.acc = 0.0
+        self.synced_acc = np.zeros(capacity)
+
+    def reset(self):
+        """
+        Brings the values of the visited keys up to date and clears all
+        traces.
+        """
+        self.sync()
+        super().reset()
+        self.scale = 1.0
+        self.acc = 0.0
+
+    def sync(self):
+        """
+        Brings the values of all visited keys up to date.
+        """
+        size = self.size
+        self.table[self.keys[:size]] += (self.lrate * self.traces[:size] *
+                                         (self.acc - self.synced_acc[:size]))
+        self.synced_acc[:size] = self.acc
+
+    def visit(self, key):
+        """
+        Sets the trace of the given key to 1.
+        """
+        slot = self.get_slot(key)
+        self.table[key] += (self.lrate * self.traces[slot] *
+                            (self.acc - self.synced_acc[slot]))
+        self.synced_acc[slot] = self.acc
+        self.traces[slot] = 1 / self.scale
+
+    def visit_keys(self, keys):
+        """
+        Visits each key in the given array of distinct keys.
+        """
+        slots = np.array([self.get_slot(key) for key in keys.tolist()])
+        self.table[keys] += (self.lrate * self.traces[slots] *
+                             (self.acc - self.synced_acc[slots]))
+        self.synced_acc[slots] = self.acc
+        self.traces[slots] = 1 / self.scale
+
+    def update(self, td_error):
+        """
+        Updates the values of all visited keys given the td_error, and decays
+        their traces.
+        """
+        self.acc += td_error * self.scale
+        self.scale *= self.decay
+        if self.scale < self.min_scale:
+            self.renormalize()
+
+    def renormalize(self):
+        """
+        Folds the global scale into the stored traces and drops keys whose
+        trace has become negligible.
+        """
+        self.sync()
+        size = self.size
+        self.traces[:size] *= self.scale
+        keep = self.traces[:size] >= self.min_trace
+        self.size = np.count_nonzero(keep)
+        self.keys[:self.size] = self.keys[:size][keep]
+        self.traces[:self.size] = self.traces[:size][keep]
+        self.synced_acc[:self.size] = 0
+        self.index = {key: slot for slot, key in
+                      enumerate(self.keys[:self.size].tolist())}
+        self.acc = 0.0
+        self.scale = 1.0
+
+    def get_value(self, key):
+        """
+        Returns the value of the given key.
+        """
+        slot = self.index.get(key)
+        if slot is None:
+            return self.table[key]
+        return self.table[key] + self.lrate * self.traces[slot] * (
+            self.acc - self.synced_acc[slot])
+
+    def get_values(self, keys):
+        """
+        Returns the values of the given array of keys.
+        """
+        return np.array([self.get_value(key) for key in keys.tolist()])
+
+    def get_value_range(self, start, stop):
+        """
+        Returns the values of the keys in range(start, stop).
+        """
+        return np.array([self.get_value(key) for key in range(start, stop)])
+
+    def get_trace(self, key):
+        """
+        Returns the trace of the given key.
+        """
+        slot = self.index.get(key)
+        if slot is None:
+            return 0
+        return self.traces[slot] * self.scale
+
+    def get_slot(self, key):
+        """
+        Returns the array slot of the given key, allocating one if the key
+        has not been visited yet.
+        """
+        slot = self.index.get(key)
+        if slot is None:
+            slot = super().get_slot(key)
+            self.synced_acc[slot] = self.acc
+        return slot
+
+    def grow(self):
+        """
+        Doubles the capacity of the arrays.
+        """
+        super().grow()
+        self.synced_acc = np.resize(self.synced_acc, len(self.keys))
+
+
+class BatchEligibilityTraces:
+    """
+    Eligibility traces of several sim worlds playing their own episodes in
+    lockstep, all updating the same table.
+
+    Every sim world has its own slot for each key visited in its episode,
+    with the same trace, decay and gain as in EligibilityTraces, so a single
+    sim world gets exactly the updates of the serial learner. All slots are
+    updated with the TD-error of their sim world and decayed in one
+    vectorized step, adding to the table with np.add.at so that keys with
+    slots in several sim worlds get all of their updates. The slots of a sim
+    world are cleared when its episode ends, and the arrays are compacted
+    once half of their slots have been cleared.
+    """
+
+    def __init__(self, table, lrate, decay, capacity=1024):
+        self.table = table
+        self.lrate = lrate
+        self.decay = decay
+        # Slot of each (sim world, key) pair visited
+        self.index = {}
+        self.size = 0
+        # Number of slots cleared since the arrays were last compacted
+        self.cleared = 0
+        self.keys = np.zeros(capacity, dtype=int)
+        self.envs = np.zeros(capacity, dtype=int)
+        self.traces = np.zeros(capacity)
+        # As in EligibilityTraces
+        self.decay_pow = np.ones(capacity)
+        self.gain = np.zeros(capacity)
+
+    def visit(self, keys):
+        """
+        Sets the trace of each of the given keys, one per sim world, to 1,
+        counting one more occurrence of it in the sim world's episode.
+        """
+        pairs = list(enumerate(keys.tolist()))
+        slots = [self.index.get(pair) for pair in pairs]
+        if None in slots:
+            slots = [self.get_slot(env, key) for env, key in pairs]
+        self.traces[slots] = 1
+        self.gain[slots] += self.decay_pow[slots]
+        self.decay_pow[slots] *= self.decay
+
+    def update(self, td_errors):
+        """
+        Updates the values of all visited keys given the TD-error of each sim
+        world, and decays their traces.
+        """
+        size = self.size
+        np.add.at(self.table, self.keys[:size],
+                  self.lrate * td_errors[self.envs[:size]] *
+                  self.traces[:size] * self.gain[:size])
+        self.traces[:size] *= self.decay_pow[:size]
+
+    def reset(self, dones):
+        """
+        Clears the traces of the sim worlds marked in the boolean array
+        'dones'.
+        """
+        size = self.size
+        done = dones[self.envs[:size]] & (self.gain[:size] > 0)
+        for pair in zip(self.envs[:size][done].tolist(),
+                        self.keys[:size][done].tolist()):
+            del self.index[pair]
+        # Cleared slots stay in the arrays, adding nothing to the table
+        self.traces[:size][done] = 0
+        self.gain[:size][done] = 0
+        self.cleared += np.count_nonzero(done)
+        if 2 * self.cleared > size:
+            self.compact()
+
+    def compact(self):
+        """
+        Drops the cleared slots from the arrays.
+        """
+        size = self.size
+        keep = self.gain[:size] > 0
+        self.size = np.count_nonzero(keep)
+        self.cleared = 0
+        for array in (self.keys, self.envs, self.traces, self.decay_pow,
+                      self.gain):
+            array[:self.size] = array[:size][keep]
+        self.index = {
+            pair: slot for slot, pair in enumerate(
+                zip(self.envs[:self.size].tolist(),
+                    self.keys[:self.size].tolist()))
+        }
+
+    def get_trace(self, env, key):
+        """
+        Returns the trace of the given key in the given sim world.
+        """
+        slot = self.index.get((env, key))
+        if slot is None:
+            return 0
+        return self.traces[slot]
+
+    def get_slot(self, env, key):
+        """
+        Returns the array slot of the given key in the given sim world,
+        allocating one if the sim world has not visited the key yet.
+        """
+        slot = self.index.get((env, key))
+        if slot is not None:
+            return slot
+        if self.size == len(self.keys):
+            self.grow()
+        slot = self.size
+        self.size += 1
+        self.index[(env, key)] = slot
+        self.keys[slot] = key
+        self.envs[slot] = env
+        self.traces[slot] = 0
+        self.decay_pow[slot] = 1
+        self.gain[slot] = 0
+        return slot
+
+    def grow(self):
+        """
+        Doubles the capacity of the arrays.
+        """
+        capacity = 2 * len(self.keys)
+        self.keys = np.resize(self.keys, capacity)
+        self.envs = np.resize(self.envs, capacity)
+        self.traces = np.resize(self.traces, capacity)
+        self.decay_pow = np.resize(self.decay_pow, capacity)
+        self.gain = np.resize(self.gain, capacity)
@@ -0,0 +1,315 @@
+"""haakon8855"""
+
+import json
+import os
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Preallocated array holding the last 'capacity' values appended to it.
+    """
+
+    def __init__(self, capacity, dtype=float):
+        self.values = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        # Total number of values appended, the next one goes to
+        # self.count % self.capacity
+        self.count = 0
+
+    def append(self, value):
+        """
+        Appends the value, overwriting the oldest one if the buffer is full.
+        """
+        self.values[self.count % self.capacity] = value
+        self.count += 1
+
+    def get_values(self):
+        """
+        Returns the values held, from the oldest to the newest.
+        """
+        if self.count <= self.capacity:
+            return self.values[:self.count]
+        start = self.count % self.capacity
+        return np.concatenate((self.values[start:], self.values[:start]))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+class DownsampledHistory:
+    """
+    History of every value appended, stored as the means of buckets of
+    consecutive values in an array of fixed capacity. Each time the array
+    fills up, neighbouring buckets are merged and the bucket size doubles,
+    so the whole history can be plotted without its memory growing.
+    """
+
+    def __init__(self, capacity=1000):
+        # The capacity is kept even, so that buckets merge in pairs
+        self.means = np.zeros(capacity + capacity % 2)
+        self.size = 0
+        self.bucket_size = 1
+        # Sum and count of the values in the bucket being filled
+        self.pending_sum = 0
+        self.pending_count = 0
+
+    def append(self, value):
+        """
+        Adds the value to the bucket being filled, storing the bucket's mean
+        once it is full.
+        """
+        self.pending_sum += value
+        self.pending_count += 1
+        if self.pending_count < self.bucket_size:
+            return
+        self.means[self.size] = self.pending_sum / self.bucket_size
+        self.size += 1
+        self.pending_sum = 0
+        self.pending_count = 0
+        if self.size == len(self.means):
+            half = self.size // 2
+            self.means[:half] = (self.means[0::2] + self.means[1::2]) / 2
+            self.size = half
+            self.bucket_size *= 2
+
+    def get_values(self):
+        """
+        Returns the index of the first value in each full bucket, and the
+        means of the buckets.
+        """
+        return (np.arange(self.size) * self.bucket_size,
+                self.means[:self.size].copy())
+
+
+class EpisodeStats:
+    """
+    Bounded-memory record of a per-episode value, e.g. the game length.
+    Keeps running totals over all episodes, the values of the last 'window'
+    episodes for rolling statistics and a downsampled history for plotting.
+    """
+
+    def __init__(self, window=100, capacity=1000):
+        self.recent = RingBuffer(window)
+        self.history = DownsampledHistory(capacity)
+        self.count = 0
+        self.total = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def append(self, value):
+        """
+        Records the value of one episode.
+        """
+        self.recent.append(value)
+        self.history.append(value)
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def extend(self, values):
+        """
+        Records the values of several episodes.
+        """
+        for value in np.asarray(values).tolist():
+            self.append(value)
+
+    def get_mean(self):
+        """
+        Returns the mean over all episodes.
+        """
+        return self.total / self.count if self.count > 0 else float('nan')
+
+    def get_rolling_stats(self):
+        """
+        Returns the mean, min, max and 10th, 50th and 90th percentiles of
+        the last 'window' episodes.
+        """
+        values = self.recent.get_values()
+        if len(values) == 0:
+            return {}
+        p10, p50, p90 = np.percentile(values, (10, 50, 90))
+        return {
+            'mean': float(np.mean(values)),
+            'min': float(np.min(values)),
+            'max': float(np.max(values)),
+            'p10': float(p10),
+            'p50': float(p50),
+            'p90': float(p90),
+        }
+
+    def plot(self):
+        """
+        Plots the downsampled history against the episode number.
+        """
+        from matplotlib import pyplot as plt
+        plt.plot(*self.history.get_values())
+        plt.show()
+
+    def get_arrays(self, prefix):
+        """
+        Returns the state of the record as a dict of arrays, with keys
+        starting with 'prefix', for checkpointing.
+        """
+        history = self.history
+        return {
+            prefix + 'recent': self.recent.get_values(),
+            prefix + 'history': history.means[:history.size],
+            prefix + 'totals': np.array([
+                self.count, self.total, self.min, self.max,
+                history.bucket_size, history.pending_sum,
+                history.pending_count
+            ], dtype=float),
+        }
+
+    def set_arrays(self, arrays, prefix):
+        """
+        Restores the state of the record from arrays given by get_arrays.
+        """
+        self.recent.count = 0
+        for value in arrays[prefix + 'recent'].tolist():
+            self.recent.append(value)
+        means = arrays[prefix + 'history']
+        history = self.history
+        history.means[:len(means)] = means
+        history.size = len(means)
+        (count, self.total, self.min, self.max, bucket_size,
+         history.pending_sum,
+         pending_count) = arrays[prefix + 'totals'].tolist()
+        self.count = int(count)
+        history.bucket_size = int(bucket_size)
+        history.pending_count = int(pending_count)
+
+    def __len__(self):
+        return self.count
+
+
+class SampledTrajectory:
+    """
+    Opt-in capture of the trajectory of every 'every'-th episode, e.g. the
+    angle of the pole in each step, into a preallocated array of
+    'max_length' values. The best captured trajectory is kept in a second
+    array, so memory stays the same however many episodes are run. Nothing
+    is captured if 'every' is 0.
+    """
+
+    def __init__(self, max_length, every=0, dtype=float):
+        self.every = every
+        self.current = np.zeros(max_length, dtype=dtype)
+        self.best = np.zeros(max_length, dtype=dtype)
+        self.length = 0
+        self.best_length = 0
+        self.episodes = 0
+        # Whether the current episode is captured
+        self.active = False
+
+    def start(self, value):
+        """
+        Starts the trajectory of a new episode at the given value, capturing
+        it if it is sampled.
+        """
+        self.active = self.every > 0 and self.episodes % self.every == 0
+        self.episodes += 1
+        self.length = 0
+        self.record(value)
+
+    def record(self, value):
+        """
+        Appends the value to the trajectory if the episode is captured.
+        Values past 'max_length' are dropped.
+        """
+        if self.active and self.length < len(self.current):
+            self.current[self.length] = value
+            self.length += 1
+
+    def keep_as_best(self):
+        """
+        Keeps the trajectory of the current episode, if captured, as the
+        best one.
+        """
+        if self.active:
+            self.current, self.best = self.best, self.current
+            self.best_length = self.length
+            self.active = False
+
+    def get_best(self):
+        """
+        Returns the best trajectory kept.
+        """
+        return self.best[:self.best_length]
+
+
+class EpisodeLog:
+    """
+    Streams one record per episode to a file, either as a line of JSON or,
+    if 'binary' is True, as a fixed-size row of the structured dtype FIELDS
+    that can be read back with np.fromfile. Records are written as they
+    come, so nothing accumulates in memory.
+    """
+
+    FIELDS = np.dtype([('episode', np.int64), ('steps', np.int64),
+                       ('secs', np.float64), ('epsilon', np.float64),
+                       ('mean_steps', np.float64)])
+
+    def __init__(self, path, binary=False, append=False):
+        self.binary = binary
+        mode = 'a' if append else 'w'
+        # The file stays open until closed, so no with-statement is used
+        # pylint: disable=consider-using-with
+        if binary:
+            self.file = open(path, mode + 'b')
+        else:
+            self.file = open(path, mode, encoding='utf-8')
+
+    def write(self, record):
+        """
+        Writes the record, a dict with the keys of FIELDS.
+        """
+        if self.binary:
+            row = np.array(tuple(record[name] for name in self.FIELDS.names),
+                           dtype=self.FIELDS)
+            row.tofile(self.file)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self.file.close()
+
+    @staticmethod
+    def read(path, binary=False):
+        """
+        Reads the records of a log as a structured array if binary, or as a
+        list of dicts otherwise.
+        """
+        if binary:
+            return np.fromfile(path, dtype=EpisodeLog.FIELDS)
+        with open(path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    @staticmethod
+    def truncate(path, episodes, binary=False):
+        """
+        Drops the records of the log from the first one of an episode
+        numbered 'episodes' or higher, e.g. those written after the
+        checkpoint a run resumes from. Does nothing if there is no log.
+        """
+        if not os.path.exists(path):
+            return
+        if binary:
+            records = EpisodeLog.read(path, binary)
+            late = np.flatnonzero(records['episode'] >= episodes)
+            count = late[0] if len(late) > 0 else len(records)
+            size = count * EpisodeLog.FIELDS.itemsize
+        else:
+            size = 0
+            with open(path, 'rb') as file:
+                for line in file:
+                    if json.loads(line)['episode'] >= episodes:
+                        break
+                    size += len(line)
+        with open(path, 'r+b') as file:
+            file.truncate(size)
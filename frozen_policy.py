@@ -0,0 +1,79 @@
+"""haakon8855"""
+
+import numpy as np
+
+
+class FrozenPolicy:
+    """
+    Read-only greedy policy, stored as an array with the best action of
+    every state ID.
+
+    The array is exported to a .npy-file after training and memory-mapped
+    when loaded, so looking up an action is a single array read and any
+    number of processes loading the same file share one copy of it through
+    the page cache. The states themselves are stored in a second file next
+    to it, and are only read if actions are looked up by state.
+    """
+
+    def __init__(self, path):
+        self.actions = np.load(path, mmap_mode='r')
+        self.states_path = FrozenPolicy.get_states_path(path)
+        self.state_ids = None
+
+    def get_action(self, state_id):
+        """
+        Returns the greedy action in the state with the given ID.
+        """
+        return int(self.actions[state_id])
+
+    def get_actions(self, state_ids):
+        """
+        Returns an array with the greedy action in each of the states with
+        the given IDs.
+        """
+        return self.actions[state_ids]
+
+    def get_state_id(self, state):
+        """
+        Returns the ID of the given state. The mapping from states to IDs is
+        built on the first call.
+        """
+        if self.state_ids is None:
+            states = np.load(self.states_path, mmap_mode='r')
+            self.state_ids = {
+                tuple(state): i
+                for i, state in enumerate(states.tolist())
+            }
+        return self.state_ids[state]
+
+    @staticmethod
+    def get_states_path(path):
+        """
+        Returns the path of the file holding the states of the policy
+        exported to 'path'.
+        """
+        if path.endswith('.npy'):
+            path = path[:-len('.npy')]
+        return path + '_states.npy'
+
+    @staticmethod
+    def export(path, policy, state_index, sim_world):
+        """
+        Writes the greedy action of every state in the state index, given
+        the actor's table of state-action values, to 'path'. Only legal
+        actions are considered, and ties go to the lowest action.
+        """
+        num_states = len(state_index)
+        values = np.full((num_states, policy.shape[1]), -np.inf)
+        for state_id in range(num_states):
+            legal_mask = sim_world.get_legal_action_mask(
+                state_index.get_state(state_id))
+            values[state_id, legal_mask] = policy[state_id, legal_mask]
+        actions = np.argmax(values, axis=1).astype(
+            np.min_scalar_type(policy.shape[1] - 1))
+        # Written through file objects, as np.save would otherwise add
+        # '.npy' to paths without it
+        with open(path, 'wb') as file:
+            np.save(file, actions)
+        with open(FrozenPolicy.get_states_path(path), 'wb') as file:
+            np.save(file, state_index.get_states_array())
@@ -1,15 +1,22 @@
 """haakon8855"""
 
-from random import randint, random
-from matplotlib import pyplot as plt
+import numpy as np
 
+from sim_world import SimWorld
+from random_streams import RandomStream
+from episode_metrics import EpisodeStats, SampledTrajectory
 
-class Gambler:
+
+class Gambler(SimWorld):
     """
     Gambler class for holding the simulated world of the gambler.
     """
 
-    def __init__(self, win_prob=0.4, max_steps=300):
+    def __init__(self,
+                 win_prob=0.4,
+                 max_steps=300,
+                 trajectory_every=0,
+                 rng=None):
         # Constants:
         self.max_coins = 100
         self.min_bet = 1
@@ -20,11 +27,24 @@ class Gambler:
         self.current_step = 0
         self.max_steps = max_steps
         self.failed = False
-        self.history = []
-        self.historic_game_length = []
-        self.best_history = []
+        # Stream drawing the initial coins and the coin flips
+        self.rng = rng if rng is not None else RandomStream()
+        # Coins in every step of every 'trajectory_every'-th episode,
+        # keeping the shortest of those episodes
+        self.trajectory = SampledTrajectory(max_steps + 1, trajectory_every,
+                                            np.int64)
+        self.historic_game_length = EpisodeStats()
         self.best_game_length = float('inf')
         self.possible_actions = []
+        # Legal-action mask of every amount of coins. Wagers range from the
+        # minimum bet to the coins needed to either win or lose, and only the
+        # minimum bet is legal with 0 or self.max_coins coins.
+        wagers = np.arange(self.get_num_actions())
+        coins = np.arange(self.max_coins + 1)[:, None]
+        max_bets = np.maximum(np.minimum(coins, self.max_coins - coins),
+                              self.min_bet)
+        self.legal_action_masks = (wagers >= self.min_bet) & (wagers <=
+                                                              max_bets)
 
         # Initialization
         self.produce_initial_state()
@@ -35,9 +55,9 @@ class Gambler:
         amount of coins.
         """
         self.current_step = 0
-        self.state = randint(1, 99)
+        self.state = self.rng.integers(1, 100)
         self.failed = False
-        self.history = [self.state]
+        self.trajectory.start(self.state)
         return self.get_current_state()
 
     def update(self, action: int):
@@ -55,7 +75,7 @@ class Gambler:
         self.state = self.get_child_state(action)
 
         # Cache new state for animation
-        self.history.append(self.state)
+        self.trajectory.record(self.state)
 
         # Check if state is failed state
         if not self.failed:
@@ -73,7 +93,7 @@ class Gambler:
         Does not change the world's state.
         """
         state = self.state
-        if random() < self.win_prob:
+        if self.rng.random() < self.win_prob:
             state += action  # Win money
         else:
             state -= action  # Lose money
@@ -83,8 +103,14 @@ class Gambler:
         """
         Returns the current state of the sim world.
         """
+        return self.one_hot_state(self.state)
+
+    def one_hot_state(self, coins):
+        """
+        Returns the one-hot encoding of the given amount of coins.
+        """
         oh_state = [0] * (self.max_coins + 1)
-        oh_state[self.state] = 1
+        oh_state[coins] = 1
         return tuple(oh_state)
 
     def is_current_state_final_state(self):
@@ -117,6 +143,16 @@ class Gambler:
         # Returns [1] if currents state is illegal state
         return [self.min_bet] + list(range(self.min_bet + 1, max_bet + 1))
 
+    def get_legal_action_mask(self, state=None):
+        """
+        Returns a boolean array over all wagers marking those legal in the
+        given state, or in the current state if no state is given.
+        """
+        coins = self.state
+        if state is not None:
+            coins = state.index(1)
+        return self.legal_action_masks[coins]
+
     def action_is_legal(self, action):
         """
         Returns whether the given action is legal to perform or not from the
@@ -133,22 +169,22 @@ class Gambler:
         """
         Plots the course of the current game up until current state.
         """
-        # plt.plot(self.best_history)
+        # plt.plot(self.trajectory.get_best())
         # plt.show()
 
     def plot_historic_game_length(self):
         """
         Plots the number of steps used in each historic game.
         """
-        plt.plot(self.historic_game_length)
-        plt.show()
+        self.historic_game_length.plot()
 
     def store_game_length(self):
         """
-        Stores the game length in a list to plot later.
+        Stores the game length to plot later.
         """
-        if self.current_step < self.best_game_length:
-            self.best_history = self.history.copy()
+        if (self.trajectory.active
+                and self.current_step < self.best_game_length):
+            self.trajectory.keep_as_best()
             self.best_game_length = self.current_step
         self.historic_game_length.append(self.current_step)
 
@@ -158,6 +194,91 @@ class Gambler:
         """
         return len(self.get_current_state())
 
+    def get_num_states(self):
+        """
+        Returns the number of distinct states, i.e. amounts of coins.
+        """
+        return self.max_coins + 1
+
+    def get_state_number(self, state):
+        """
+        Returns the amount of coins of the given one-hot-encoded state.
+        """
+        return state.index(1)
+
+    def get_num_actions(self):
+        """
+        Returns the number of actions. Actions are wagers, so this is one more
+        than the largest wager possible.
+        """
+        return self.max_coins // 2 + 1
+
     def __str__(self):
         outstring = f"state: {self.state}"
         return outstring
+
+
+class GamblerSolver:
+    """
+    Solves the gambler problem exactly by vectorized value iteration.
+
+    Uses the same rewards as the Gambler sim world, i.e. the number of coins
+    won or lost in each step, so the state values are directly comparable
+    to those learned by the critic. Timeouts are ignored.
+    """
+
+    def __init__(self, win_prob=0.4, max_coins=100, drate=1, theta=1e-9):
+        self.win_prob = win_prob
+        self.max_coins = max_coins
+        self.drate = drate
+        self.theta = theta
+        # Values of every amount of coins, and of every amount of coins and
+        # wager, where illegal wagers are -inf. Wager 0 is never legal.
+        self.state_values = np.zeros(max_coins + 1)
+        self.state_action_values = None
+        self.value_iteration()
+
+    def value_iteration(self):
+        """
+        Runs value iteration until the largest change in any state value is
+        less than theta.
+        """
+        coins = np.arange(self.max_coins + 1)[:, None]
+        wagers = np.arange(self.max_coins // 2 + 1)[None, :]
+        max_bet = np.minimum(coins, self.max_coins - coins)
+        legal = (wagers >= 1) & (wagers <= max_bet)
+        # Clip illegal wagers so they index valid states, they are masked
+        win = np.minimum(coins + wagers, self.max_coins)
+        lose = np.maximum(coins - wagers, 0)
+        values = self.state_values
+        while True:
+            state_action_values = np.where(
+                legal, self.win_prob * (wagers + self.drate * values[win]) +
+                (1 - self.win_prob) * (-wagers + self.drate * values[lose]),
+                -np.inf)
+            # 0 and max_coins are final states with value 0
+            new_values = np.max(state_action_values, axis=1)
+            new_values[[0, self.max_coins]] = 0
+            delta = np.max(np.abs(new_values - values))
+            values = new_values
+            if delta < self.theta:
+                break
+        self.state_values = values
+        self.state_action_values = state_action_values
+
+    def get_optimal_actions(self, tolerance=1e-6):
+        """
+        Returns a boolean array marking, for every amount of coins, the
+        wagers whose value is within 'tolerance' of the best one.
+        """
+        best = np.max(self.state_action_values, axis=1, keepdims=True)
+        return self.state_action_values >= best - tolerance
+
+    def get_wagers(self, tolerance=1e-6):
+        """
+        Returns the smallest optimal wager for every amount of coins, and 0
+        for the final states.
+        """
+        wagers = np.argmax(self.get_optimal_actions(tolerance), axis=1)
+        wagers[[0, self.max_coins]] = 0
+        return wagers
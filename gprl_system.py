@@ -1,14 +1,23 @@
 """haakon8855"""
 
+import argparse
 import json
-from matplotlib import pyplot as plt
+import os
+from functools import partial
 import numpy as np
 
 from configuration import Config
 from reinforcement_learning import ReinforcementLearning
-from pole_balancing import PoleBalancing
+from pole_balancing import PoleBalancing, BatchPoleBalancing
 from hanoi import Hanoi
-from gambler import Gambler
+from gambler import Gambler, GamblerSolver
+from tile_coding import TileCoder
+from vector_sim_world import VectorSimWorld
+from state_index import NumberedStateIndex
+from hogwild import HogwildTrainer
+from episode_metrics import EpisodeLog
+from random_streams import RandomStream
+from instrumentation import PhaseTimers, profile
 
 
 class GPRLSystem:
@@ -16,14 +25,51 @@ class GPRLSystem:
     General purpose reinforcement learning system
     """
 
-    def __init__(self, config_file: str):
+    def __init__(self, config_file: str, overrides=None, visualize=True):
         # Fetching configuration parameters from given config file
         self.config = Config.get_config(config_file)
         conf_globals = self.config['GLOBALS']
+        # Parameters given in 'overrides' take precedence over the config
+        if overrides is not None:
+            for key, value in overrides.items():
+                conf_globals[key] = str(value)
+        # A headless run never imports matplotlib, and may skip the final
+        # greedy episode and stream per-episode metrics to a file instead.
+        self.visualize = visualize and conf_globals.get('headless',
+                                                        'false') != 'true'
+        self.evaluate = conf_globals.get('evaluate', 'true') == 'true'
+        self.metrics_file = conf_globals.get('metrics_file')
+        self.binary_metrics = conf_globals.get('metrics_format',
+                                               'jsonl') == 'binary'
+        # The trajectory of every 'trajectory_every'-th episode is captured
+        # to plot the best one, which is only done when visualizing
+        trajectory_every = int(
+            conf_globals.get('trajectory_every', 1 if self.visualize else 0))
+        # Training state is saved to the checkpoint file every
+        # 'checkpoint_every' episodes, and resumed from it if it exists and
+        # 'resume' is set.
+        self.checkpoint_file = conf_globals.get('checkpoint_file')
+        self.checkpoint_every = int(conf_globals.get('checkpoint_every', 100))
+        self.resume = conf_globals.get('resume', 'false') == 'true'
+        # Every 'phase_timers'-th call of each hot-path method is timed if
+        # not 0, and the whole run is profiled with cProfile if 'profile'
+        # is set, dumping the statistics to 'profile_file' if given
+        self.phase_timers = int(conf_globals.get('phase_timers', 0))
+        self.profile = conf_globals.get('profile', 'false') == 'true'
+        self.profile_file = conf_globals.get('profile_file')
+        # The greedy policy is exported to this file after training
+        self.policy_file = conf_globals.get('policy_file')
         self.problem = conf_globals['problem']
         self.episodes = int(conf_globals['episodes'])
         self.max_steps = int(conf_globals['max_steps'])
-        self.table_critic = conf_globals['table_critic'] == 'true'
+        # The critic backend is either 'table', 'keras' or 'numpy_mlp'. If
+        # not given, 'table_critic' chooses between a table and Keras.
+        if 'critic_backend' in conf_globals:
+            self.critic_backend = conf_globals['critic_backend']
+            self.table_critic = self.critic_backend == 'table'
+        else:
+            self.table_critic = conf_globals['table_critic'] == 'true'
+            self.critic_backend = 'table' if self.table_critic else 'keras'
         self.epsilon = float(conf_globals['epsilon'])
         self.actor_lrate = float(conf_globals['actor_lrate'])
         self.critic_lrate = float(conf_globals['critic_lrate'])
@@ -31,15 +77,38 @@ class GPRLSystem:
         self.drate = float(conf_globals['drate'])
         self.verbose = conf_globals['verbose'] == 'true'
 
-        # If a seed is specified in the config, we will set the random seed
+        # If a seed is specified in the config, we will set the random seed.
+        # The learner, the sim world and the copies of it in batched
+        # training draw from their own streams spawned from it.
         self.seed = None
         if 'seed' in conf_globals:
             self.seed = int(conf_globals['seed'])
+        self.learner_rng, sim_world_rng, vector_rng = RandomStream(
+            self.seed).spawn(3)
+
+        # Lazily decayed eligibility traces trade exact replay of the
+        # episode history for a per-step cost independent of its length
+        self.lazy_traces = False
+        if 'lazy_traces' in conf_globals:
+            self.lazy_traces = conf_globals['lazy_traces'] == 'true'
 
         # If the critic is neural-network-based, we fetch the network's shape
         self.network_dimensions = None
+        self.nn_epochs = 10
+        self.nn_batch_size = 32
         if not self.table_critic:
             self.network_dimensions = json.loads(conf_globals['nn_dims'])
+            if 'nn_epochs' in conf_globals:
+                self.nn_epochs = int(conf_globals['nn_epochs'])
+            if 'nn_batch_size' in conf_globals:
+                self.nn_batch_size = int(conf_globals['nn_batch_size'])
+
+        # Replay buffer for the NN-based critic, disabled unless a
+        # capacity is given
+        self.replay_capacity = int(conf_globals.get('replay_capacity', 0))
+        self.replay_every = int(conf_globals.get('replay_every', 1))
+        self.replay_schedule = conf_globals.get('replay_schedule', 'episodes')
+        self.replay_batches = int(conf_globals.get('replay_batches', 10))
 
         # Fetch parameters specific to the cartpole problem and create
         # an instance of the simworld.
@@ -48,11 +117,12 @@ class GPRLSystem:
             self.mass_p = float(conf_globals['pole_mass'])
             self.gravity = float(conf_globals['gravity'])
             self.tau = float(conf_globals['timestep'])
-            self.sim_world = PoleBalancing(self.length,
-                                           self.mass_p,
-                                           self.gravity,
-                                           self.tau,
-                                           max_steps=self.max_steps)
+            make_sim_world = partial(PoleBalancing,
+                                     self.length,
+                                     self.mass_p,
+                                     self.gravity,
+                                     self.tau,
+                                     max_steps=self.max_steps)
         # Fetch parameters specific to the ToH problem and create
         # an instance of the simworld.
         elif self.problem == 'hanoi':
@@ -61,43 +131,177 @@ class GPRLSystem:
             anim_delay = 0.5
             if 'anim_delay' in conf_globals:
                 anim_delay = float(conf_globals['anim_delay'])
-            self.sim_world = Hanoi(num_pegs=num_pegs,
-                                   num_discs=num_discs,
-                                   animation_delay=anim_delay,
-                                   max_steps=self.max_steps)
+            precompute = False
+            if 'precompute' in conf_globals:
+                precompute = conf_globals['precompute'] == 'true'
+            make_sim_world = partial(Hanoi,
+                                     num_pegs=num_pegs,
+                                     num_discs=num_discs,
+                                     animation_delay=anim_delay,
+                                     max_steps=self.max_steps,
+                                     precompute=precompute)
         # Fetch parameters specific to the gambler problem and create
         # an instance of the simworld.
         elif self.problem == 'gambler':
             win_prob = float(conf_globals['win_prob'])
-            self.sim_world = Gambler(win_prob=win_prob)
+            make_sim_world = partial(Gambler, win_prob=win_prob)
+        else:
+            raise Exception(f"Unknown problem '{self.problem}'")
+        self.sim_world = make_sim_world(trajectory_every=trajectory_every,
+                                        rng=sim_world_rng)
+
+        # Batched training of the table based critic on 'num_envs' copies of
+        # the sim world stepping in lockstep
+        self.vector_sim_world = None
+        num_envs = int(conf_globals.get('num_envs', 1))
+        if num_envs > 1 and self.problem == 'cartpole':
+            # The carts are stepped as arrays rather than one by one
+            self.vector_sim_world = BatchPoleBalancing(num_envs,
+                                                       self.length,
+                                                       self.mass_p,
+                                                       self.gravity,
+                                                       self.tau,
+                                                       self.max_steps,
+                                                       rng=vector_rng)
+        elif num_envs > 1:
+            self.vector_sim_world = VectorSimWorld(make_sim_world, num_envs,
+                                                   vector_rng)
+
+        # Tile coding of the unrounded cartpole state, for a linear actor
+        # and critic in place of the rounded tables
+        self.tile_coder = None
+        if conf_globals.get('tile_coding', 'false') == 'true':
+            if self.problem != 'cartpole':
+                raise Exception(
+                    "Tile coding is only supported for the cartpole problem")
+            lows, highs = self.sim_world.get_observation_bounds()
+            self.tile_coder = TileCoder(
+                lows, highs, int(conf_globals.get('num_tilings', 8)),
+                int(conf_globals.get('tiles_per_dim', 8)))
+
+        # Hogwild training in 'num_workers' worker processes sharing the
+        # tables, where states get the same IDs in every process
+        num_workers = int(conf_globals.get('num_workers', 1))
+        state_index = None
+        if num_workers > 1:
+            if (not self.table_critic or self.tile_coder is not None
+                    or self.vector_sim_world is not None):
+                raise Exception("Worker processes are only supported for the "
+                                "table critic without num_envs")
+            if (self.checkpoint_file is not None
+                    or self.policy_file is not None):
+                raise Exception("Worker processes do not support "
+                                "checkpoints or policy export")
+            if self.phase_timers > 0:
+                raise Exception("Worker processes do not support phase "
+                                "timers")
+            state_index = NumberedStateIndex(self.sim_world)
 
         # Create the reinforcement learner instance, passing necessary params
-        self.reinforcement_learner = ReinforcementLearning(
-            self.sim_world, self.episodes, self.max_steps, self.table_critic,
-            self.epsilon, self.actor_lrate, self.critic_lrate,
-            self.trace_decay, self.drate, self.verbose, self.seed,
-            self.network_dimensions)
+        self.reinforcement_learner = self.make_learner(state_index)
+        if num_workers > 1:
+            HogwildTrainer(self.reinforcement_learner, config_file, overrides,
+                           num_workers, self.seed)
+
+        # Initialize the actor and critic from the exact solution of the
+        # gambler problem if specified in the config.
+        if self.problem == 'gambler' and conf_globals.get('warm_start',
+                                                          'false') == 'true':
+            self.warm_start_gambler()
+
+        self.resumed = (self.resume and self.checkpoint_file is not None
+                        and os.path.exists(self.checkpoint_file))
+        if self.resumed:
+            self.reinforcement_learner.load_checkpoint(self.checkpoint_file)
 
         # Run visualization of the gambler policy before training if current
         # run solves the gambler problem.
-        if self.problem == 'gambler':
+        if self.problem == 'gambler' and self.visualize:
             self.before = True
             self.visualize_gambler_policy()
 
+    def make_learner(self, state_index=None):
+        """
+        Returns a reinforcement learner on the sim world with the configured
+        parameters, interning states by the given state index if any.
+        """
+        return ReinforcementLearning(
+            self.sim_world, self.episodes, self.max_steps, self.table_critic,
+            self.epsilon, self.actor_lrate, self.critic_lrate,
+            self.trace_decay, self.drate, self.verbose, self.seed,
+            self.network_dimensions, self.lazy_traces, self.nn_epochs,
+            self.nn_batch_size, self.replay_capacity, self.replay_every,
+            self.replay_schedule, self.replay_batches, self.critic_backend,
+            self.tile_coder, self.vector_sim_world, state_index,
+            self.learner_rng)
+
     def run(self):
         """
-        Runs the reinforcement learning system on the specified problem/simworld
+        Runs the reinforcement learning system on the specified
+        problem/simworld
         """
-        self.reinforcement_learner.train()
+        timers = None
+        if self.phase_timers > 0:
+            timers = PhaseTimers(self.phase_timers)
+            timers.attach(self.reinforcement_learner)
+        if self.profile:
+            profile(self.train, self.profile_file)
+        else:
+            self.train()
+        if timers is not None:
+            timers.detach()
+            timers.print_report()
+        if self.policy_file is not None:
+            self.reinforcement_learner.export_policy(self.policy_file)
         # Run visualization of the gambler policy after training if current
         # run solves the gambler problem.
-        if self.problem == 'gambler':
+        if self.problem == 'gambler' and self.visualize:
             self.visualize_gambler_policy()
 
+    def train(self):
+        """
+        Trains the reinforcement learner, streaming the metrics of every
+        episode to the metrics file if given.
+        """
+        if self.metrics_file is None:
+            self.reinforcement_learner.train(self.visualize, self.evaluate,
+                                             None, self.checkpoint_file,
+                                             self.checkpoint_every)
+        else:
+            # A resumed run adds to the metrics of the run it resumes, after
+            # dropping those of the episodes played after its checkpoint
+            if self.resumed:
+                EpisodeLog.truncate(self.metrics_file,
+                                    self.reinforcement_learner.episode,
+                                    self.binary_metrics)
+            log = EpisodeLog(self.metrics_file, self.binary_metrics,
+                             self.resumed)
+            try:
+                self.reinforcement_learner.train(self.visualize,
+                                                 self.evaluate, log.write,
+                                                 self.checkpoint_file,
+                                                 self.checkpoint_every)
+            finally:
+                log.close()
+
+    def warm_start_gambler(self):
+        """
+        Initializes the critic's state values and the actor's policy with
+        the values found by solving the gambler problem exactly.
+        """
+        solver = GamblerSolver(self.sim_world.win_prob,
+                               self.sim_world.max_coins, self.drate)
+        coins = range(1, self.sim_world.max_coins)
+        states = [self.sim_world.one_hot_state(coin) for coin in coins]
+        self.reinforcement_learner.warm_start(
+            states, solver.state_values[coins],
+            solver.state_action_values[coins])
+
     def visualize_gambler_policy(self):
         """
         Visualizes the policy for the gambler simworld.
         """
+        from matplotlib import pyplot as plt
         min_state = 1
         max_state = self.sim_world.max_coins
         states_xaxis = list(range(min_state, max_state))
@@ -119,13 +323,22 @@ def main():
     """
     Main function for running this python script.
     """
-
-    # gprl = GPRLSystem("configs/config_pole.ini")
-    # gprl = GPRLSystem("configs/config_hanoi.ini")
-    gprl = GPRLSystem("configs/config_gambler.ini")
-    # gprl = GPRLSystem("configs/config_pole_nn.ini")
-    # gprl = GPRLSystem("configs/config_hanoi_nn.ini")
-    # gprl = GPRLSystem("configs/config_gambler_nn.ini")
+    parser = argparse.ArgumentParser(description=GPRLSystem.__doc__)
+    # Other configs are found in configs/, e.g. config_pole.ini,
+    # config_hanoi.ini or config_gambler_nn.ini
+    parser.add_argument('config',
+                        nargs='?',
+                        default="configs/config_gambler.ini",
+                        help='config file to run')
+    parser.add_argument('--headless',
+                        action='store_true',
+                        help='run without any plotting')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='run under cProfile and print a report')
+    args = parser.parse_args()
+    overrides = {'profile': 'true'} if args.profile else None
+    gprl = GPRLSystem(args.config, overrides, visualize=not args.headless)
     gprl.run()
 
 
@@ -1,55 +1,76 @@
 """haakon8855"""
 
-from matplotlib import pyplot as plt
+import os
+import numpy as np
 
+from sim_world import SimWorld
+from random_streams import RandomStream
+from episode_metrics import EpisodeStats, SampledTrajectory
 
-class Hanoi:
+
+class Hanoi(SimWorld):
     """
     Hanoi class for holding the simulated world of 'Towers of Hanoi'.
+
+    The state is packed into an integer as described in HanoiRules, and all
+    transitions, legal moves and encodings come from HanoiRules' pure
+    functions. Their results are memoized per state, or looked up in
+    precomputed tables over every state.
     """
 
     def __init__(self,
                  num_pegs=3,
                  num_discs=3,
                  animation_delay=0.5,
-                 max_steps=300):
+                 max_steps=300,
+                 precompute=False,
+                 trajectory_every=0,
+                 rng=None):
         # Constants:
         self.num_pegs = num_pegs
         self.num_discs = num_discs
         self.animation_delay = animation_delay
+        self.rules = HanoiRules(num_pegs, num_discs)
+        # All possible moves (source peg, target peg), disregarding state
+        # and illegal moves. Actions are indexes into this list.
+        self.possible_actions = self.rules.actions
+        # If precompute is True, transitions, legal actions and encodings
+        # are looked up in tables over all states instead of computed
+        self.tables = None
+        if precompute:
+            self.tables = HanoiTables.load(num_pegs, num_discs)
+        # Memoized one-hot encodings, child states and legal-action masks of
+        # the packed states seen so far, and the packed state of each
+        # encoding
+        self.state_tuples = {}
+        self.child_states = {}
+        self.legal_masks = {}
+        self.state_ids = {}
         # State parameters:
-        self.state = [0 for _ in range(num_discs)]
+        self.state = self.rules.initial_state
         self.current_step = 0
         self.max_steps = max_steps
         self.failed = False
-        self.history = []
-        self.best_history = []
+        # The game is deterministic, but holds a stream like the other sim
+        # worlds
+        self.rng = rng if rng is not None else RandomStream()
+        # Packed state in every step of every 'trajectory_every'-th
+        # episode, keeping the shortest of those episodes
+        self.trajectory = SampledTrajectory(max_steps + 1, trajectory_every,
+                                            np.int64)
         self.best_game_length = float('inf')
-        self.historic_game_length = []
-        self.possible_actions = []
-        self.calculate_possible_actions()
+        self.historic_game_length = EpisodeStats()
         self.produce_initial_state()
 
-    def calculate_possible_actions(self):
-        """
-        Populates the list of all possible moves. (Disregarding state and
-        illegal moves.)
-        """
-        # All combinations of movement from peg i to j, where i != j
-        for i in range(self.num_pegs):
-            for j in range(self.num_pegs):
-                if i != j:
-                    self.possible_actions.append((i, j))
-
     def produce_initial_state(self):
         """
         Initializes the sim world to its initial state where all blocks are
         placed on the leftmost pole.
         """
         self.current_step = 0
-        self.state = [0 for _ in range(self.num_discs)]
+        self.state = self.rules.initial_state
         self.failed = False
-        self.history = [self.state.copy()]
+        self.trajectory.start(self.state)
         return self.get_current_state()
 
     def update(self, action: int):
@@ -60,14 +81,15 @@ class Hanoi:
         """
         self.current_step += 1
 
-        if not self.action_is_legal(action):
+        # Transition to next state given an action, illegal actions lead to
+        # state -1
+        state = self.get_child_state(action)
+        if state < 0:
             raise Exception("Illegal action")
-
-        # Transition to next state given an action
-        self.state = self.get_child_state(action)
+        self.state = state
 
         # Store state for animation
-        self.history.append(self.state.copy())
+        self.trajectory.record(self.state)
 
         # Update state values with the newly updated ones
         if not self.failed:
@@ -77,36 +99,59 @@ class Hanoi:
         # Reward is -1 as long as the goal is not reached
         return -1
 
-    def get_child_state(self, action: int):
+    def get_child_state(self, action: int, state=None):
         """
-        Returns the child state if given action is performed.
-        Does not change the world's state.
+        Returns the packed child state if given action is performed in the
+        given packed state, or the current state if not given, or -1 if the
+        action is illegal. Does not change the world's state.
         """
-        state = self.state
-        action_indexes = self.possible_actions[action]
-        for i in range(len(state) - 1, -1, -1):
-            if state[i] == action_indexes[0]:
-                state[i] = action_indexes[1]
-                break
-        return state
+        if state is None:
+            state = self.state
+        if self.tables is not None:
+            return int(self.tables.next_state[state, action])
+        child_states = self.child_states.get(state)
+        if child_states is None:
+            child_states = self.rules.get_child_states(state).tolist()
+            self.child_states[state] = child_states
+        return child_states[action]
 
     def get_current_state(self):
         """
         Returns the current state of the sim world as a concatenation of
         one-hot-encoded vectors.
         """
-        oh_state = Hanoi.one_hot_state(self.state, self.num_pegs)
-        return tuple(oh_state)
+        return self.get_state_tuple(self.state)
+
+    def get_state_tuple(self, state):
+        """
+        Returns the one-hot encoding of the given packed state as a tuple.
+        """
+        if self.tables is not None:
+            return self.tables.state_tuples[state]
+        state_tuple = self.state_tuples.get(state)
+        if state_tuple is None:
+            state_tuple = tuple(self.rules.one_hot(state).tolist())
+            self.state_tuples[state] = state_tuple
+            self.state_ids[state_tuple] = state
+        return state_tuple
+
+    def get_state_id(self, state_tuple):
+        """
+        Returns the packed state of the given one-hot encoding.
+        """
+        if self.tables is not None:
+            return self.tables.state_ids[state_tuple]
+        state = self.state_ids.get(state_tuple)
+        if state is None:
+            state = int(self.rules.from_one_hot(state_tuple))
+        return state
 
     def is_current_state_final_state(self):
         """
         Returns whether the current state is a final state.
         Returns True if all blocks are on the rightmost pole.
         """
-        for disc in self.state:
-            if disc != self.num_pegs - 1:
-                return False
-        return True
+        return self.state == self.rules.final_state
 
     def is_current_state_failed_state(self):
         """
@@ -117,47 +162,49 @@ class Hanoi:
 
     def get_legal_actions(self, state=None):
         """
-        Returns a list of legal actions in the current state. The action (int)
-        is an index mapping to the list of all possible moves.
+        Returns a list of legal actions in the given one-hot-encoded state,
+        or the current state if not given. The action (int) is an index
+        mapping to the list of all possible moves.
         """
-        if state is None:
-            state = self.state
-        legal_actions = []
-        for i in range(len(self.possible_actions)):
-            if self.action_is_legal(i):
-                legal_actions.append(i)
-        return legal_actions
-
-    def action_is_legal(self, action):
-        """
-        Returns whether the given action is legal to perform or not from the
-        current state.
-        
-        self.state = [a, b, c]
-        action = (d, e)
-        Action 'action' is legal if value of 'd' is encountered before value
-        of 'e' when iterating backwards through 'self.state'.
-        E.g. if c == e, action is not allowed, but if c != d != e and b == c,
-        action is legal.
-        """
-        for i in range(len(self.state) - 1, -1, -1):
-            if self.state[i] == self.possible_actions[action][1]:
-                return False
-            if self.state[i] == self.possible_actions[action][0]:
-                return True
+        return np.flatnonzero(self.get_legal_action_mask(state)).tolist()
+
+    def get_legal_action_mask(self, state=None):
+        """
+        Returns a boolean array over all actions marking those legal in the
+        given one-hot-encoded state, or in the current state if no state is
+        given.
+        """
+        state_id = self.state
+        if state is not None:
+            state_id = self.get_state_id(state)
+        if self.tables is not None:
+            return self.tables.legal[state_id]
+        legal_mask = self.legal_masks.get(state_id)
+        if legal_mask is None:
+            legal_mask = self.rules.get_legal_mask(state_id)
+            self.legal_masks[state_id] = legal_mask
+        return legal_mask
+
+    def action_is_legal(self, action, state=None):
+        """
+        Returns whether the given action is legal to perform in the given
+        packed state, or the current state if not given.
+        """
+        return self.get_child_state(action, state) >= 0
 
     def plot_history_best_episode(self):
         """
-        Plots the course of the best game.
+        Plots the course of the best captured game.
         """
-        for i, state in enumerate(self.best_history):
-            self.plot_hanoi_state(state, i)
+        for i, state in enumerate(self.trajectory.get_best().tolist()):
+            self.plot_hanoi_state(self.rules.unpack(state).tolist(), i)
 
     def plot_hanoi_state(self, state, step):
         """
         Plot one state of towers of hanoi with graphical representation of
         pegs and discs.
         """
+        from matplotlib import pyplot as plt
         _, axis = plt.subplots()
         # Set axis ranges
         axis.set_xlim((0, self.num_pegs * 10))
@@ -185,15 +232,15 @@ class Hanoi:
         """
         Plots the number of steps used in each historic game.
         """
-        plt.plot(self.historic_game_length)
-        plt.show()
+        self.historic_game_length.plot()
 
     def store_game_length(self):
         """
-        Stores the game length in a list to plot later.
+        Stores the game length to plot later.
         """
-        if self.current_step < self.best_game_length:
-            self.best_history = self.history.copy()
+        if (self.trajectory.active
+                and self.current_step < self.best_game_length):
+            self.trajectory.keep_as_best()
             self.best_game_length = self.current_step
         self.historic_game_length.append(self.current_step)
 
@@ -203,28 +250,177 @@ class Hanoi:
         """
         return self.num_pegs * self.num_discs
 
+    def get_num_states(self):
+        """
+        Returns the number of distinct states, i.e. placements of the discs.
+        """
+        return self.num_pegs**self.num_discs
+
+    def get_state_number(self, state):
+        """
+        Returns the packed state of the given one-hot encoding.
+        """
+        return self.get_state_id(state)
+
+    def get_num_actions(self):
+        """
+        Returns the number of possible moves.
+        """
+        return len(self.possible_actions)
+
     def __str__(self):
-        outstring = f"state: {self.state}"
+        outstring = f"state: {self.rules.unpack(self.state).tolist()}"
         return outstring
 
-    @staticmethod
-    def one_hot_state(state, num_pegs):
+
+class HanoiRules:
+    """
+    The rules of a Towers of Hanoi configuration as pure functions of a
+    packed state.
+
+    A state is packed into the integer whose i-th base-num_pegs digit is the
+    peg of disc i, where disc 0 is the largest. States are never modified,
+    so results can be memoized, and every function also takes an array of
+    states and then returns one result per state.
+    """
+
+    def __init__(self, num_pegs, num_discs):
+        self.num_pegs = num_pegs
+        self.num_discs = num_discs
+        self.num_states = num_pegs**num_discs
+        # All discs on the leftmost peg, and all discs on the rightmost peg
+        self.initial_state = 0
+        self.final_state = self.num_states - 1
+        self.powers = num_pegs**np.arange(num_discs)
+        # All moves (source peg, target peg) between two different pegs
+        self.actions = [(i, j) for i in range(num_pegs)
+                        for j in range(num_pegs) if i != j]
+        self.sources = np.array([source for source, _ in self.actions])
+        self.targets = np.array([target for _, target in self.actions])
+
+    def pack(self, pegs):
+        """
+        Returns the packed state where disc i is on peg pegs[..., i].
+        """
+        return np.asarray(pegs) @ self.powers
+
+    def unpack(self, state):
         """
-        Returns the one-hot encoding of the state representatinon given.
+        Returns the peg of each disc in the given packed state.
         """
-        oh_state = []
-        for pos in state:
-            oh_state += Hanoi.one_hot_variable(pos, num_pegs)
-        return oh_state
+        return np.asarray(state)[..., None] // self.powers % self.num_pegs
+
+    def one_hot(self, state):
+        """
+        Returns the concatenated one-hot encodings of the peg of each disc
+        in the given packed state.
+        """
+        pegs = self.unpack(state)
+        return (pegs[..., None] == np.arange(self.num_pegs)).reshape(
+            (*pegs.shape[:-1], -1)).astype(np.int8)
+
+    def from_one_hot(self, one_hot):
+        """
+        Returns the packed state of the given one-hot encoding.
+        """
+        one_hot = np.asarray(one_hot)
+        pegs = one_hot.reshape(
+            (*one_hot.shape[:-1], self.num_discs, self.num_pegs)).argmax(-1)
+        return self.pack(pegs)
+
+    def get_top_discs(self, state):
+        """
+        Returns the index of the top (smallest) disc on each peg in the given
+        packed state, or -1 if the peg is empty.
+        """
+        pegs = self.unpack(state)
+        return np.where(pegs[..., None] == np.arange(self.num_pegs),
+                        np.arange(self.num_discs)[:, None], -1).max(axis=-2)
+
+    def get_legal_mask(self, state):
+        """
+        Returns a boolean array over all actions marking those legal in the
+        given packed state. A move is legal if the top disc of the source is
+        smaller than the top disc of the target, i.e. has a greater index.
+        """
+        top = self.get_top_discs(state)
+        return top[..., self.sources] > top[..., self.targets]
+
+    def get_child_states(self, state):
+        """
+        Returns the packed state reached by each action from the given
+        packed state, or -1 for illegal actions.
+        """
+        state = np.asarray(state)
+        top = self.get_top_discs(state)
+        moved_discs = top[..., self.sources]
+        legal = moved_discs > top[..., self.targets]
+        # Moving disc i from peg s to peg t changes its digit by t - s
+        moved = self.powers[moved_discs] * (self.targets - self.sources)
+        return np.where(legal, state[..., None] + moved, -1)
+
+
+class HanoiTables:
+    """
+    Precomputed tables over every state of a Towers of Hanoi configuration.
+
+    A state is identified by the integer whose i-th base-num_pegs digit is
+    the peg of disc i. The tables hold the one-hot encoding of every state
+    and the next state for every action, where -1 marks an illegal action.
+    They are cached on disk keyed by the number of pegs and discs.
+    """
+
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'cache')
+
+    def __init__(self, num_pegs, num_discs, one_hot, next_state):
+        self.num_pegs = num_pegs
+        self.num_discs = num_discs
+        self.one_hot = one_hot
+        self.next_state = next_state
+        self.legal = next_state >= 0
+        # Python objects handed out by the sim world, built once
+        self.state_tuples = [tuple(row) for row in one_hot.tolist()]
+        self.state_ids = {
+            state: state_id
+            for state_id, state in enumerate(self.state_tuples)
+        }
 
     @staticmethod
-    def one_hot_variable(disc_pos: int, num_pegs: int):
+    def build(num_pegs, num_discs):
         """
-        Returns the one-hot encoding of one rounded state variable
+        Enumerates every state and returns the tables.
         """
-        vector = [0] * (num_pegs)
-        vector[disc_pos] = 1
-        return vector
+        rules = HanoiRules(num_pegs, num_discs)
+        state_ids = np.arange(rules.num_states)
+        return HanoiTables(num_pegs, num_discs, rules.one_hot(state_ids),
+                           rules.get_child_states(state_ids))
+
+    @staticmethod
+    def load(num_pegs, num_discs):
+        """
+        Returns the tables for the given configuration, loading them from the
+        cache if present and building and caching them otherwise. The cache
+        file is written next to its path first and then moved into place,
+        so processes building the same tables at once never read a partly
+        written file.
+        """
+        path = os.path.join(HanoiTables.cache_dir,
+                            f"hanoi_{num_pegs}_{num_discs}.npz")
+        if os.path.exists(path):
+            with np.load(path) as tables:
+                return HanoiTables(num_pegs, num_discs, tables['one_hot'],
+                                   tables['next_state'])
+        tables = HanoiTables.build(num_pegs, num_discs)
+        os.makedirs(HanoiTables.cache_dir, exist_ok=True)
+        # Named by process, so that processes do not write the same file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            np.savez_compressed(file,
+                                one_hot=tables.one_hot,
+                                next_state=tables.next_state)
+        os.replace(temp_path, path)
+        return tables
 
 
 if __name__ == "__main__":
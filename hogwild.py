@@ -0,0 +1,186 @@
+"""haakon8855"""
+
+import multiprocessing
+import queue
+from multiprocessing.shared_memory import SharedMemory
+from time import time
+import numpy as np
+
+from state_index import NumberedStateIndex
+
+
+class SharedArray:
+    """
+    NumPy array in a block of shared memory. The process creating it owns
+    the block, while other processes attach to it by name.
+    """
+
+    def __init__(self, shape, dtype=float, name=None):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * self.dtype.itemsize)
+        self.owner = name is None
+        self.memory = SharedMemory(name=name, create=self.owner, size=size)
+        self.name = self.memory.name
+        self.array = np.ndarray(shape, self.dtype, buffer=self.memory.buf)
+
+    def close(self):
+        """
+        Detaches from the block, freeing it if this process owns it. The
+        array must not be used afterwards.
+        """
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class HogwildTrainer:
+    """
+    Trains a table based ReinforcementLearning instance with worker
+    processes, each playing its own episodes on its own sim world while
+    reading and writing the actor's and critic's tables in shared memory.
+
+    Updates to the tables are not locked, as in Hogwild, so updates from
+    workers writing the same entry at the same time may be lost. States are
+    given the same IDs in every process by a NumberedStateIndex. The
+    trainer coordinates the workers: each claims the next episode from a
+    shared counter, plays it with the global epsilon and reports its length
+    to the trainer, which records it, reports its metrics and decays the
+    global epsilon as in serial training. Episodes are counted in the order
+    they end. The shared memory is only held while training. The episode
+    end hooks are called by the trainer, but the episode start and step
+    hooks would have to run in the workers, so training refuses to start
+    if any are registered, as PhaseTimers refuses to attach.
+    """
+
+    def __init__(self, learner, config_file, overrides, num_workers,
+                 seed=None):
+        self.learner = learner
+        self.config_file = config_file
+        self.overrides = dict(overrides or {})
+        self.num_workers = num_workers
+        self.seed = seed
+        learner.hogwild_trainer = self
+
+    def train(self, metrics_callback=None):
+        """
+        Copies the learner's tables into shared memory and runs the workers
+        until the learner's number of episodes have ended, then copies the
+        tables out of shared memory and frees it.
+        """
+        learner = self.learner
+        if learner.hooks['episode_start'] or learner.hooks['step']:
+            raise Exception("Episode start and step hooks are not supported "
+                            "with worker processes")
+        policy = SharedArray(learner.actor.policy.shape)
+        policy.array[:] = learner.actor.policy
+        state_value = SharedArray(learner.critic.state_value.shape)
+        state_value.array[:] = learner.critic.state_value
+        try:
+            learner.actor.use_policy(policy.array)
+            learner.critic.use_state_value(state_value.array)
+            self.run_workers(policy, state_value, metrics_callback)
+        finally:
+            learner.actor.use_policy(policy.array.copy())
+            learner.critic.use_state_value(state_value.array.copy())
+            policy.close()
+            state_value.close()
+
+    def run_workers(self, policy, state_value, metrics_callback):
+        """
+        Runs the workers on the given shared arrays until the learner's
+        number of episodes have ended.
+        """
+        learner = self.learner
+        context = multiprocessing.get_context()
+        next_episode = context.Value('q', learner.episode)
+        epsilon = context.Value('d', learner.epsilon, lock=False)
+        results = context.Queue()
+        seeds = [None] * self.num_workers
+        if self.seed is not None:
+            seeds = [
+                int(child.generate_state(1)[0]) for child in
+                np.random.SeedSequence(self.seed).spawn(self.num_workers)
+            ]
+        workers = []
+        for worker_seed in seeds:
+            worker = context.Process(
+                target=run_worker,
+                args=(self.config_file, self.overrides,
+                      (policy.name, policy.shape),
+                      (state_value.name, state_value.shape),
+                      next_episode, epsilon, results, worker_seed),
+                daemon=True)
+            worker.start()
+            workers.append(worker)
+        try:
+            for _ in range(learner.episode, learner.episodes):
+                result = self.get_result(results, workers)
+                if isinstance(result, Exception):
+                    raise result
+                game_length, secs = result
+                learner.finish_episode(learner.episode, secs,
+                                       metrics_callback, game_length)
+                learner.advance_episode(learner.episode, None, 1)
+                epsilon.value = learner.epsilon
+        finally:
+            for worker in workers:
+                worker.join(timeout=10)
+                if worker.is_alive():
+                    worker.terminate()
+
+    @staticmethod
+    def get_result(results, workers):
+        """
+        Returns the next result reported by the workers, raising an
+        exception if they have all exited without reporting it.
+        """
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    raise Exception(  # pylint: disable=raise-missing-from
+                        "The worker processes exited before all episodes "
+                        "were played")
+
+
+def run_worker(config_file, overrides, policy, state_value, next_episode,
+               epsilon, results, seed):
+    """
+    Runs a worker of HogwildTrainer, playing episodes on a learner built
+    from the given config, with its tables replaced by the shared arrays
+    given by name and shape, until the shared episode counter reaches the
+    number of episodes.
+    """
+    # Imported here, as gprl_system imports this module
+    # pylint: disable=import-outside-toplevel
+    from gprl_system import GPRLSystem
+    try:
+        overrides = dict(overrides, num_workers=1, verbose='false')
+        if seed is not None:
+            overrides['seed'] = seed
+        # Without a seed, the worker's streams are seeded by the OS
+        gprl = GPRLSystem(config_file, overrides, visualize=False)
+        learner = gprl.make_learner(NumberedStateIndex(gprl.sim_world))
+        # The shared arrays are kept referenced, as the memory is detached
+        # from when they are garbage collected
+        shared_policy = SharedArray(policy[1], name=policy[0])
+        shared_state_value = SharedArray(state_value[1], name=state_value[0])
+        learner.actor.use_policy(shared_policy.array)
+        learner.critic.use_state_value(shared_state_value.array)
+        while True:
+            with next_episode.get_lock():
+                if next_episode.value >= learner.episodes:
+                    break
+                next_episode.value += 1
+            learner.epsilon = epsilon.value
+            start_time = time()
+            learner.one_episode()
+            results.put((gprl.sim_world.current_step, time() - start_time))
+        # Apply the pending updates of lazily decayed traces
+        learner.actor.initiate_eligibility()
+        learner.critic.initiate_eligibility()
+    except Exception as error:  # pylint: disable=broad-except
+        results.put(error)
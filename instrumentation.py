@@ -0,0 +1,132 @@
+"""haakon8855"""
+
+import cProfile
+import pstats
+from time import perf_counter
+
+
+class PhaseTimers:
+    """
+    Counts the calls to the hot-path methods of a ReinforcementLearning
+    instance and times every 'sample_every'-th of them, grouped into the
+    phases of a step. The methods are wrapped on the instances when
+    attached and restored when detached, so the timers cost nothing unless
+    attached, and timing only a sample of the calls keeps the cost low when
+    they are.
+    """
+
+    # Methods of each phase, given as (attribute of the learner, method),
+    # where an empty attribute means the learner itself. Methods that the
+    # actor, critic or sim world in use do not have are skipped. The
+    # methods of the vector sim world and the batched methods of the actor
+    # and critic are those of batched training.
+    PHASES = {
+        'env_update': [('sim_world', 'update'), ('vector_sim_world', 'step')],
+        'encode': [('sim_world', 'get_current_state'),
+                   ('sim_world', 'get_observation'),
+                   ('vector_sim_world', 'get_state_tuples'),
+                   ('tile_coder', 'get_active_features'),
+                   ('state_index', 'get_id')],
+        'get_action': [('', 'get_action'), ('actor', 'get_proposed_actions')],
+        'td_error': [('critic', 'get_td_error'), ('critic', 'get_td_errors')],
+        'traces': [('critic', 'update_traced_state_values'),
+                   ('actor', 'update_state_action_values'),
+                   ('critic', 'update_batch_state_values'),
+                   ('actor', 'update_batch_state_action_values')],
+        'critic_fit': [('critic', 'update_state_values'),
+                       ('critic', 'train_from_replay')],
+    }
+
+    def __init__(self, sample_every=1):
+        self.sample_every = sample_every
+        self.calls = dict.fromkeys(self.PHASES, 0)
+        self.sampled_calls = dict.fromkeys(self.PHASES, 0)
+        self.sampled_secs = dict.fromkeys(self.PHASES, 0.0)
+        # The (instance, method name) pairs wrapped
+        self.wrapped = []
+
+    def attach(self, learner):
+        """
+        Wraps the hot-path methods of the learner and its sim world, state
+        index, tile coder, actor and critic. Learners training in worker
+        processes are refused, as the workers' methods are not wrapped.
+        """
+        if learner.hogwild_trainer is not None:
+            raise Exception("Phase timers are not supported with worker "
+                            "processes")
+        for phase, methods in self.PHASES.items():
+            for attribute, name in methods:
+                owner = getattr(learner, attribute) if attribute else learner
+                if owner is None or not hasattr(owner, name):
+                    continue
+                setattr(owner, name, self.wrap(phase, getattr(owner, name)))
+                self.wrapped.append((owner, name))
+
+    def detach(self):
+        """
+        Restores the methods wrapped by attach.
+        """
+        for owner, name in self.wrapped:
+            delattr(owner, name)
+        self.wrapped = []
+
+    def wrap(self, phase, function):
+        """
+        Returns a wrapper of the given function that counts its calls and
+        times every 'sample_every'-th of them as part of the given phase.
+        """
+        calls = self.calls
+        sampled_calls = self.sampled_calls
+        sampled_secs = self.sampled_secs
+        sample_every = self.sample_every
+
+        def wrapper(*args, **kwargs):
+            calls[phase] += 1
+            if calls[phase] % sample_every != 0:
+                return function(*args, **kwargs)
+            start_time = perf_counter()
+            result = function(*args, **kwargs)
+            sampled_secs[phase] += perf_counter() - start_time
+            sampled_calls[phase] += 1
+            return result
+
+        return wrapper
+
+    def get_report(self):
+        """
+        Returns the number of calls of each phase and the time spent in it,
+        estimated from the sampled calls.
+        """
+        report = {}
+        for phase, calls in self.calls.items():
+            secs = 0.0
+            if self.sampled_calls[phase] > 0:
+                secs = (self.sampled_secs[phase] / self.sampled_calls[phase] *
+                        calls)
+            report[phase] = {'calls': calls, 'secs': secs}
+        return report
+
+    def print_report(self):
+        """
+        Prints the calls of each phase, the estimated time spent in it and
+        the time per call.
+        """
+        print(f"{'Phase':<12}{'Calls':>10}{'Secs':>10}{'us/call':>10}")
+        for phase, stats in self.get_report().items():
+            per_call = stats['secs'] / max(1, stats['calls']) * 1e6
+            print(f"{phase:<12}{stats['calls']:>10}"
+                  f"{stats['secs']:>10.3f}{per_call:>10.2f}")
+
+
+def profile(function, output=None, lines=25):
+    """
+    Calls the function under cProfile and prints the functions with the
+    most cumulative time. The raw statistics are also dumped to 'output' if
+    given, e.g. to be viewed with snakeviz. Returns the function's result.
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function)
+    if output is not None:
+        profiler.dump_stats(output)
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(lines)
+    return result
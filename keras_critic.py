@@ -0,0 +1,148 @@
+"""haakon8855"""
+
+from time import time
+import tensorflow as tf
+from tensorflow import keras as ks
+import numpy as np
+
+
+class KerasStateValueNetwork:
+    """
+    Neural network estimating state values for the NN based critic.
+    Only imported when the critic is not table-based, so that table-based
+    runs never pay for importing TensorFlow.
+    """
+
+    def __init__(self, nn_dims, lrate, seed=None, batch_size=32, rng=None):
+        # NumPy Generator drawing the seeds of the initial weights and the
+        # mini-batches, seeded by 'seed' unless given
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        self.nn_dims = nn_dims
+        self.lrate = lrate
+        self.batch_size = batch_size
+        self.model = None
+        # NumPy copies of the (kernel, bias) of each layer in the network,
+        # used for inference without calling Keras.
+        self.weights = None
+        # Compiled training step, traced on the first update
+        self.train_step = None
+        # Seconds spent in the compiled training step and in the rest of
+        # training since the timers were last reset
+        self.train_time = 0
+        self.train_overhead = 0
+        self.init_neural_network()
+
+    def init_neural_network(self):
+        """
+        Initializes the neural network.
+        """
+        opt = ks.optimizers.Adam  # NN optimizer
+        model = ks.models.Sequential()  # Init base model
+
+        # Populate layers, with Keras' default Glorot uniform kernels seeded
+        # from self.rng, so that neither Keras' nor any global RNG is used
+        for i, nodes in enumerate(self.nn_dims):
+            initializer = ks.initializers.GlorotUniform(
+                seed=int(self.rng.integers(2**31)))
+            activation = 'tanh' if i < len(self.nn_dims) - 1 else None
+            model.add(
+                ks.layers.Dense(nodes,
+                                activation=activation,
+                                kernel_initializer=initializer))
+        model.compile(optimizer=opt(learning_rate=self.lrate), loss='mse')
+        # Store model reference
+        self.model = model
+
+    def get_state_values(self, states):
+        """
+        Returns the values of a block of states, given one state per row, in
+        one forward pass through the network.
+        """
+        states = np.asarray(states, dtype=np.float32)
+        if self.weights is None:
+            # The network is built on its first call
+            values = self.model(states).numpy()[:, 0]
+            self.refresh_weights()
+            return values
+        activations = states
+        for kernel, bias in self.weights[:-1]:
+            activations = np.tanh(activations @ kernel + bias)
+        kernel, bias = self.weights[-1]
+        return (activations @ kernel + bias)[:, 0]
+
+    def refresh_weights(self):
+        """
+        Copies the weights of the network to the NumPy arrays used for
+        inference.
+        """
+        self.weights = [layer.get_weights() for layer in self.model.layers]
+
+    def set_weights(self, weights):
+        """
+        Sets the weights of the network from a flat list of the kernel and
+        bias of each layer.
+        """
+        if self.weights is None:
+            self.model.build((None, weights[0].shape[0]))
+        self.model.set_weights(weights)
+        self.refresh_weights()
+
+    def reset_timers(self):
+        """
+        Resets the time spent training and in overhead to 0.
+        """
+        self.train_time = 0
+        self.train_overhead = 0
+
+    def train(self, states, targets, epochs):
+        """
+        Trains for the given number of epochs over shuffled mini-batches of
+        the given states and targets, using a compiled training step that is
+        reused across calls.
+        """
+        start_time = time()
+        states = np.asarray(states, dtype=np.float32)
+        if self.weights is None:
+            # Build the network by calling it, as an episode may end before
+            # any state has been evaluated
+            self.get_state_values(states[:1])
+        if self.train_step is None:
+            self.init_train_step(states.shape[1])
+        targets = np.asarray(targets, dtype=np.float32).reshape((-1, 1))
+        train_time = 0
+        for _ in range(epochs):
+            order = self.rng.permutation(len(states))
+            for i in range(0, len(states), self.batch_size):
+                batch = order[i:i + self.batch_size]
+                batch_states = tf.constant(states[batch])
+                batch_targets = tf.constant(targets[batch])
+                step_start_time = time()
+                self.train_step(batch_states, batch_targets)
+                train_time += time() - step_start_time
+        self.refresh_weights()
+        self.train_time += train_time
+        self.train_overhead += time() - start_time - train_time
+
+    def init_train_step(self, state_length):
+        """
+        Compiles the training step of the network into a graph, for states
+        of the given length. The network must have been built, which happens
+        on its first call.
+        """
+        model = self.model
+        optimizer = model.optimizer
+        loss_function = ks.losses.MeanSquaredError()
+
+        @tf.function(input_signature=[
+            tf.TensorSpec((None, state_length), tf.float32),
+            tf.TensorSpec((None, 1), tf.float32)
+        ])
+        def train_step(states, targets):
+            with tf.GradientTape() as tape:
+                loss = loss_function(targets, model(states, training=True))
+            gradients = tape.gradient(loss, model.trainable_variables)
+            optimizer.apply_gradients(
+                zip(gradients, model.trainable_variables))
+            return loss
+
+        self.train_step = train_step
@@ -0,0 +1,158 @@
+"""haakon8855"""
+
+from time import time
+import numpy as np
+
+
+class NumpyStateValueNetwork:
+    """
+    Neural network estimating state values for the NN based critic, written
+    in NumPy with manual backpropagation and the Adam optimizer. Has the
+    same layers as KerasStateValueNetwork (tanh hidden layers and a linear
+    output layer, mean squared error loss), but needs no TensorFlow and has
+    far less overhead per call for networks as small as the ones used here.
+    """
+
+    def __init__(self,
+                 nn_dims,
+                 lrate,
+                 seed=None,
+                 batch_size=32,
+                 beta_1=0.9,
+                 beta_2=0.999,
+                 epsilon=1e-7,
+                 rng=None):
+        # NumPy Generator drawing the initial weights and the mini-batches,
+        # seeded by 'seed' unless given
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        self.nn_dims = nn_dims
+        self.lrate = lrate
+        self.batch_size = batch_size
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.epsilon = epsilon
+        # [kernel, bias] of each layer, built on the first call when the
+        # length of the states is known
+        self.weights = None
+        # Adam's moment estimates for each weight array, and step count
+        self.moments = None
+        self.velocities = None
+        self.adam_steps = 0
+        # Seconds spent in gradient steps and in the rest of training since
+        # the timers were last reset
+        self.train_time = 0
+        self.train_overhead = 0
+
+    def init_neural_network(self, state_length):
+        """
+        Initializes the weights with Glorot uniform kernels and zero biases,
+        as Keras' Dense layers do.
+        """
+        self.weights = []
+        inputs = state_length
+        for nodes in self.nn_dims:
+            limit = np.sqrt(6 / (inputs + nodes))
+            kernel = self.rng.uniform(-limit, limit, (inputs, nodes))
+            self.weights.append(
+                [kernel.astype(np.float32),
+                 np.zeros(nodes, dtype=np.float32)])
+            inputs = nodes
+        self.moments = [[np.zeros_like(w) for w in layer]
+                        for layer in self.weights]
+        self.velocities = [[np.zeros_like(w) for w in layer]
+                           for layer in self.weights]
+
+    def set_weights(self, weights):
+        """
+        Sets the weights of the network from a flat list of the kernel and
+        bias of each layer, and resets the optimizer.
+        """
+        self.weights = [[
+            np.asarray(kernel, dtype=np.float32),
+            np.asarray(bias, dtype=np.float32)
+        ] for kernel, bias in zip(weights[::2], weights[1::2])]
+        self.moments = [[np.zeros_like(w) for w in layer]
+                        for layer in self.weights]
+        self.velocities = [[np.zeros_like(w) for w in layer]
+                           for layer in self.weights]
+        self.adam_steps = 0
+
+    def forward(self, states):
+        """
+        Returns the activations of every layer, starting with the states
+        themselves and ending with the output.
+        """
+        activations = [states]
+        for kernel, bias in self.weights[:-1]:
+            activations.append(np.tanh(activations[-1] @ kernel + bias))
+        kernel, bias = self.weights[-1]
+        activations.append(activations[-1] @ kernel + bias)
+        return activations
+
+    def get_state_values(self, states):
+        """
+        Returns the values of a block of states, given one state per row, in
+        one forward pass through the network.
+        """
+        states = np.asarray(states, dtype=np.float32)
+        if self.weights is None:
+            self.init_neural_network(states.shape[1])
+        return self.forward(states)[-1][:, 0]
+
+    def reset_timers(self):
+        """
+        Resets the time spent training and in overhead to 0.
+        """
+        self.train_time = 0
+        self.train_overhead = 0
+
+    def train(self, states, targets, epochs):
+        """
+        Trains for the given number of epochs over shuffled mini-batches of
+        the given states and targets.
+        """
+        start_time = time()
+        states = np.asarray(states, dtype=np.float32)
+        targets = np.asarray(targets, dtype=np.float32).reshape((-1, 1))
+        if self.weights is None:
+            self.init_neural_network(states.shape[1])
+        train_time = 0
+        for _ in range(epochs):
+            order = self.rng.permutation(len(states))
+            for i in range(0, len(states), self.batch_size):
+                batch = order[i:i + self.batch_size]
+                step_start_time = time()
+                self.train_step(states[batch], targets[batch])
+                train_time += time() - step_start_time
+        self.train_time += train_time
+        self.train_overhead += time() - start_time - train_time
+
+    def train_step(self, states, targets):
+        """
+        Does one step of gradient descent with Adam on the mean squared error
+        of the given mini-batch.
+        """
+        activations = self.forward(states)
+        # Gradient of the mean squared error with respect to the output
+        delta = 2 * (activations[-1] - targets) / targets.size
+        gradients = []
+        for layer in range(len(self.weights) - 1, -1, -1):
+            kernel = self.weights[layer][0]
+            gradients.append(
+                (activations[layer].T @ delta, delta.sum(axis=0)))
+            if layer > 0:
+                # Backpropagate through the tanh of the layer below
+                delta = (delta @ kernel.T) * (1 - activations[layer]**2)
+        gradients.reverse()
+        self.adam_steps += 1
+        lrate = self.lrate * np.sqrt(1 - self.beta_2**self.adam_steps) / (
+            1 - self.beta_1**self.adam_steps)
+        for weights, moments, velocities, layer_gradients in zip(
+                self.weights, self.moments, self.velocities, gradients):
+            for weight, moment, velocity, gradient in zip(
+                    weights, moments, velocities, layer_gradients):
+                moment *= self.beta_1
+                moment += (1 - self.beta_1) * gradient
+                velocity *= self.beta_2
+                velocity += (1 - self.beta_2) * gradient**2
+                weight -= lrate * moment / (np.sqrt(velocity) + self.epsilon)
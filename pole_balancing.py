@@ -1,32 +1,41 @@
 """Haakoas"""
 
-from random import uniform
 import numpy as np
-from matplotlib import pyplot as plt
 
+from sim_world import SimWorld
+from random_streams import RandomStream
+from pole_physics import get_euler_step
+from episode_metrics import EpisodeStats, SampledTrajectory
 
-class PoleBalancing:
+
+class PoleBalancing(SimWorld):
     """
     PoleBalancing class for holding the simulated world for balancing a pole
     on a cart.
     """
 
+    # Constants shared with BatchPoleBalancing:
+    mass_c = 1  # kg
+    force = 10  # N
+    max_angle = 0.21  # radians
+    max_x_pos = 2.4  # m
+
     def __init__(self,
                  length=0.5,
                  mass_p=0.1,
                  gravity=-9.8,
                  tau=0.02,
-                 max_steps=300):
+                 max_steps=300,
+                 trajectory_every=0,
+                 rng=None):
         # Constants:
         self.length = length  # m
         self.mass_p = mass_p  # kg
         self.gravity = gravity  # m/s^2
         self.tau = tau  # s, timestep length tau
-        self.mass_c = 1  # kg
-        self.force = 10  # N
-        self.max_angle = 0.21  # radians
-        self.max_x_pos = 2.4  # m
         self.steps = max_steps  # num of timesteps in episode
+        # Physics step, compiled with Numba if it is installed
+        self.euler_step = get_euler_step()
         # State parameters:
         self.angle = 0
         self.angle_vel = 0
@@ -35,10 +44,13 @@ class PoleBalancing:
         self.current_step = 0
         self.balancing_failed = False
         self.cart_exited = False
-        self.historic_angle = []
-        self.best_history = []
+        # Stream drawing the initial angles
+        self.rng = rng if rng is not None else RandomStream()
+        # Angle of the pole in every step of every 'trajectory_every'-th
+        # episode, keeping the longest of those episodes
+        self.trajectory = SampledTrajectory(max_steps + 1, trajectory_every)
         self.best_game_length = float('-inf')
-        self.historic_game_length = []
+        self.historic_game_length = EpisodeStats()
         self.produce_initial_state()
 
     def produce_initial_state(self):
@@ -48,14 +60,14 @@ class PoleBalancing:
         in the middle of the world and the angle of the pole is randomized
         between the lower and upper bound for the angle.
         """
-        self.angle = uniform(-self.max_angle, self.max_angle)
+        self.angle = self.rng.uniform(-self.max_angle, self.max_angle)
         self.angle_vel = 0
         self.x_pos = 0
         self.x_vel = 0
         self.current_step = 0
         self.balancing_failed = False
         self.cart_exited = False
-        self.historic_angle = [self.angle]
+        self.trajectory.start(self.angle)
         return self.get_current_state()
 
     def update(self, action: bool):
@@ -71,15 +83,15 @@ class PoleBalancing:
         self.angle = next_state[2]
         self.angle_vel = next_state[3]
 
-        self.historic_angle.append(self.angle)
+        self.trajectory.record(self.angle)
 
         # Update state values with the newly updated ones
         if not self.balancing_failed:
-            if np.abs(self.angle) >= self.max_angle:
+            if abs(self.angle) >= self.max_angle:
                 # If pole is outside allowed range
                 self.balancing_failed = True
         if not self.cart_exited:
-            if np.abs(self.x_pos) >= self.max_x_pos:
+            if abs(self.x_pos) >= self.max_x_pos:
                 # If cart is outside allowed range
                 self.cart_exited = True
         if self.is_current_state_failed_state():
@@ -93,50 +105,38 @@ class PoleBalancing:
         Returns the child state if given action is performed.
         """
         # Set the bangbang-force, either positive or negative F
-        bb_force = [-self.force, self.force][action]
-        # Calculate double derivatives
-        angle_acc = self.update_angle_acc(bb_force)
-        x_acc = self.update_x_acc(bb_force, angle_acc)
-        # Calculate state variables
-        x_pos = self.x_pos + self.tau * self.x_vel
-        x_vel = self.x_vel + self.tau * x_acc
-        angle = self.angle + self.tau * self.angle_vel
-        angle_vel = self.angle_vel + self.tau * angle_acc
+        bb_force = self.force if action else -self.force
+        child_state = self.euler_step(self.x_pos, self.x_vel, self.angle,
+                                      self.angle_vel, bb_force, self.length,
+                                      self.mass_p, self.mass_c, self.gravity,
+                                      self.tau)
         if rounded:
-            return PoleBalancing.round_state((x_pos, x_vel, angle, angle_vel))
-        return x_pos, x_vel, angle, angle_vel
+            return PoleBalancing.round_state(child_state)
+        return child_state
 
-    def update_angle_acc(self, bb_force):
+    def get_current_state(self):
         """
-        Updates the acceleration of the angle.
+        Returns the one-hot-encoded representation of the
+        current state of the sim world.
         """
-        numerator_fraction = (np.cos(self.angle) *
-                              (-bb_force - self.mass_p * self.length *
-                               (self.angle_vel**2) * np.sin(self.angle))) / (
-                                   self.mass_p + self.mass_c)
-        numerator = self.gravity * np.sin(self.angle) + numerator_fraction
-        denominator = self.length * (4 / 3 - (self.mass_p *
-                                              (np.cos(self.angle)**2)) /
-                                     (self.mass_p + self.mass_c))
-        return numerator / denominator
+        return PoleBalancing.round_state(
+            (self.x_pos, self.x_vel, self.angle, self.angle_vel))
 
-    def update_x_acc(self, bb_force, angle_acc):
+    def get_observation(self):
         """
-        Updates the acceleration of the cart.
+        Returns the unrounded state variables of the sim world,
+        x_pos, x_vel, angle, angle_vel.
         """
-        numerator = bb_force + self.mass_p * self.length * (
-            (self.angle_vel**2) * np.sin(self.angle) -
-            angle_acc * np.cos(self.angle))
-        denominator = self.mass_p + self.mass_c
-        return numerator / denominator
+        return self.x_pos, self.x_vel, self.angle, self.angle_vel
 
-    def get_current_state(self):
+    def get_observation_bounds(self):
         """
-        Returns the one-hot-encoded representation of the
-        current state of the sim world.
+        Returns the lower and upper bounds of the state variables within an
+        episode. The velocity bounds are rarely exceeded before the cart
+        exits or the pole falls.
         """
-        return PoleBalancing.round_state(
-            (self.x_pos, self.x_vel, self.angle, self.angle_vel))
+        highs = (self.max_x_pos, 3, self.max_angle, 3.5)
+        return tuple(-high for high in highs), highs
 
     def is_current_state_final_state(self):
         """
@@ -167,26 +167,36 @@ class PoleBalancing:
             pass
         return False, True
 
+    def get_legal_action_mask(self, state=None):
+        """
+        Returns a boolean array over all actions marking those legal, which
+        is every action in every state.
+        """
+        if state is None:
+            pass
+        return np.ones(2, dtype=bool)
+
     def plot_history_best_episode(self):
         """
-        Plots the historic angle of the pole.
+        Plots the historic angle of the pole in the longest captured episode.
         """
-        plt.plot(self.best_history)
+        from matplotlib import pyplot as plt
+        plt.plot(self.trajectory.get_best())
         plt.show()
 
     def plot_historic_game_length(self):
         """
         Plots the historic number of steps for each game.
         """
-        plt.plot(self.historic_game_length)
-        plt.show()
+        self.historic_game_length.plot()
 
     def store_game_length(self):
         """
-        Stores the game length in a list to plot later.
+        Stores the game length to plot later.
         """
-        if self.current_step > self.best_game_length:
-            self.best_history = self.historic_angle.copy()
+        if (self.trajectory.active
+                and self.current_step > self.best_game_length):
+            self.trajectory.keep_as_best()
             self.best_game_length = self.current_step
         self.historic_game_length.append(self.current_step)
 
@@ -196,6 +206,31 @@ class PoleBalancing:
         """
         return len(self.get_current_state())
 
+    def get_num_states(self):
+        """
+        Returns the number of distinct rounded states.
+        """
+        return 3 * 7 * 3 * 7
+
+    def get_state_number(self, state):
+        """
+        Returns the number of the given one-hot-encoded rounded state, with
+        the position of the hot bit of each state variable as a digit.
+        """
+        number = 0
+        offset = 0
+        for size in (3, 7, 3, 7):
+            number = (number * size +
+                      state.index(1, offset, offset + size) - offset)
+            offset += size
+        return number
+
+    def get_num_actions(self):
+        """
+        Returns the number of actions, which are pushing left or right.
+        """
+        return 2
+
     def __str__(self):
         outstring = ""
         outstring += f"\nx_pos: {self.x_pos}"
@@ -241,3 +276,184 @@ class PoleBalancing:
                 return vector
         vector[-1] = 1
         return vector
+
+
+class BatchPoleBalancing:
+    """
+    Holds N independent pole balancing sim worlds whose state variables are
+    stored as arrays, so all carts are advanced by one vectorized step. Has
+    the interface of VectorSimWorld, returning the same states as N
+    PoleBalancing sim worlds, and resets sim worlds that finish an episode
+    automatically. The initial angles of all sim worlds are drawn from one
+    random stream.
+    """
+
+    mass_c = PoleBalancing.mass_c
+    force = PoleBalancing.force
+    max_angle = PoleBalancing.max_angle
+    max_x_pos = PoleBalancing.max_x_pos
+
+    def __init__(self,
+                 num_envs,
+                 length=0.5,
+                 mass_p=0.1,
+                 gravity=-9.8,
+                 tau=0.02,
+                 max_steps=300,
+                 rng=None):
+        # Constants:
+        self.num_envs = num_envs
+        self.length = length  # m
+        self.mass_p = mass_p  # kg
+        self.gravity = gravity  # m/s^2
+        self.tau = tau  # s, timestep length tau
+        self.steps = max_steps  # num of timesteps in episode
+        # Physics step, compiled with Numba if it is installed
+        self.euler_step = get_euler_step()
+        # State parameters:
+        self.angle = np.zeros(num_envs)
+        self.angle_vel = np.zeros(num_envs)
+        self.x_pos = np.zeros(num_envs)
+        self.x_vel = np.zeros(num_envs)
+        self.current_step = np.zeros(num_envs, dtype=int)
+        self.failed = np.zeros(num_envs, dtype=bool)
+        self.rng = rng if rng is not None else RandomStream()
+        self.historic_game_length = EpisodeStats()
+        # Lengths of the episodes that ended in the last update
+        self.last_game_lengths = []
+        self.reset(np.ones(num_envs, dtype=bool))
+
+    def reset(self, mask):
+        """
+        Initializes the sim worlds selected by the boolean array 'mask' to
+        the initial state described in PoleBalancing.produce_initial_state.
+        """
+        count = np.count_nonzero(mask)
+        self.angle[mask] = self.rng.generator.uniform(-self.max_angle,
+                                                      self.max_angle, count)
+        self.angle_vel[mask] = 0
+        self.x_pos[mask] = 0
+        self.x_vel[mask] = 0
+        self.current_step[mask] = 0
+        self.failed[mask] = False
+
+    def produce_initial_state(self):
+        """
+        Starts a new episode in every sim world. Returns the initial states
+        and their legal-action masks.
+        """
+        self.reset(np.ones(self.num_envs, dtype=bool))
+        return self.get_current_state(), self.get_legal_action_masks()
+
+    def update(self, actions):
+        """
+        Advances all sim worlds by one timestep, where 'actions' tells
+        whether to push each cart right or left. See VectorSimWorld.update.
+        """
+        states, rewards, dones, legal_masks = self.step(actions)
+        return np.array(states), rewards, dones, legal_masks
+
+    def step(self, actions):
+        """
+        Same as update, but returns the reached states as a list of state
+        tuples. See VectorSimWorld.step.
+        """
+        self.current_step += 1
+        (self.x_pos, self.x_vel, self.angle,
+         self.angle_vel) = self.get_child_state(np.asarray(actions,
+                                                           dtype=bool))
+        # Failing is permanent until the sim world is reset
+        self.failed |= ((np.abs(self.angle) >= self.max_angle) |
+                        (np.abs(self.x_pos) >= self.max_x_pos))
+        states = [tuple(row) for row in self.get_current_state().tolist()]
+        # Give negative reward if agent fails, positive reward otherwise
+        rewards = np.where(self.failed, -1000.0, 1.0)
+        dones = self.failed | (self.current_step >= self.steps)
+        self.last_game_lengths = self.current_step[dones].tolist()
+        if self.last_game_lengths:
+            self.historic_game_length.extend(self.last_game_lengths)
+            self.reset(dones)
+        return states, rewards, dones, self.get_legal_action_masks()
+
+    def get_child_state(self, actions):
+        """
+        Returns the child states of all sim worlds if the given actions are
+        performed.
+        """
+        # Set the bangbang-force, either positive or negative F
+        bb_force = np.where(actions, self.force, -self.force)
+        return self.euler_step(self.x_pos, self.x_vel, self.angle,
+                               self.angle_vel, bb_force, self.length,
+                               self.mass_p, self.mass_c, self.gravity,
+                               self.tau)
+
+    def get_current_state(self):
+        """
+        Returns the one-hot-encoded representations of the current states of
+        all sim worlds as an array with one row per sim world.
+        """
+        return BatchPoleBalancing.round_state(
+            (self.x_pos, self.x_vel, self.angle, self.angle_vel))
+
+    def get_state_tuples(self, indexes):
+        """
+        Returns a list of the current states of the sim worlds with the
+        given indexes.
+        """
+        indexes = np.asarray(list(indexes), dtype=int)
+        rows = BatchPoleBalancing.round_state(
+            (self.x_pos[indexes], self.x_vel[indexes], self.angle[indexes],
+             self.angle_vel[indexes]))
+        return [tuple(row) for row in rows.tolist()]
+
+    def get_legal_action_masks(self):
+        """
+        Returns a boolean array with one row per sim world marking the legal
+        actions, which are every action in every state.
+        """
+        return np.ones((self.num_envs, self.get_num_actions()), dtype=bool)
+
+    def get_num_actions(self):
+        """
+        Returns the number of actions, which are pushing left or right.
+        """
+        return 2
+
+    def get_rng_arrays(self, prefix, first=0):
+        """
+        Returns the state of the random stream as a dict of arrays for
+        checkpointing, as VectorSimWorld.get_rng_arrays.
+        """
+        return self.rng.get_arrays(f'{prefix}{first}_')
+
+    def set_rng_arrays(self, arrays, prefix, first=0):
+        """
+        Restores the random stream from arrays given by get_rng_arrays.
+        """
+        self.rng.set_arrays(arrays, f'{prefix}{first}_')
+
+    def close(self):
+        """
+        Releases the resources held, which is nothing.
+        """
+
+    @staticmethod
+    def round_state(state):
+        """
+        Rounds the arrays of state variables and returns the one-hot-encoded
+        result, one row per sim world, as in PoleBalancing.round_state.
+        state = x_pos, x_vel, angle, angle_vel
+        """
+        rounded = (np.sign(state[0]), np.round(state[1]), np.sign(state[2]),
+                   np.round(state[3]))
+        abs_maxes = (1, 3, 1, 3)
+        one_hot = np.zeros((len(state[0]), sum(2 * m + 1 for m in abs_maxes)),
+                           dtype=int)
+        rows = np.arange(len(state[0]))
+        offset = 0
+        for rounded_var, abs_max in zip(rounded, abs_maxes):
+            # Values outside the range are put in the outermost bins
+            column = np.clip(rounded_var, -abs_max, abs_max) + abs_max
+            one_hot[rows, offset + column.astype(int)] = 1
+            offset += 2 * abs_max + 1
+        return one_hot
@@ -0,0 +1,85 @@
+"""haakon8855"""
+
+import math
+import numpy as np
+
+# euler_step compiled with Numba, or euler_step itself if Numba is not
+# installed, and the compiled euler_step_kernel, set by get_euler_step the
+# first time it is called
+compiled_euler_step = None
+numba_kernel = None
+
+
+def euler_step_kernel(x_pos, x_vel, angle, angle_vel, sin, cos, force,
+                      length, mass_p, mass_c, gravity, tau):
+    """
+    Advances the cart-pole equations by one Euler step of length tau, given
+    the sine and cosine of the angle, and returns the new x_pos, x_vel,
+    angle and angle_vel. Only uses arithmetic, so it works on scalars and
+    arrays alike, and is compiled with Numba by get_euler_step. The
+    operations are ordered as in the original PoleBalancing equations, so
+    the results are the same to the last bit.
+    """
+    mass = mass_p + mass_c
+    angle_vel_sq = angle_vel**2
+    # Calculate double derivatives
+    angle_acc = (gravity * sin +
+                 (cos * (-force - mass_p * length * angle_vel_sq * sin)) /
+                 mass) / (length * (4 / 3 - (mass_p * (cos**2)) / mass))
+    x_acc = (force + mass_p * length *
+             (angle_vel_sq * sin - angle_acc * cos)) / mass
+    # Calculate state variables
+    return (x_pos + tau * x_vel, x_vel + tau * x_acc, angle + tau * angle_vel,
+            angle_vel + tau * angle_acc)
+
+
+def euler_step(x_pos, x_vel, angle, angle_vel, force, length, mass_p, mass_c,
+               gravity, tau):
+    """
+    Advances the cart-pole equations by one Euler step, for one cart given
+    as floats or for many carts given as arrays, computing the sine and
+    cosine of the angle once. Python's math module is used for floats, as
+    it is much faster than NumPy on scalars.
+    """
+    if isinstance(angle, np.ndarray):
+        sin = np.sin(angle)
+        cos = np.cos(angle)
+    else:
+        sin = math.sin(angle)
+        cos = math.cos(angle)
+    return euler_step_kernel(x_pos, x_vel, angle, angle_vel, sin, cos, force,
+                             length, mass_p, mass_c, gravity, tau)
+
+
+def numba_euler_step(x_pos, x_vel, angle, angle_vel, force, length, mass_p,
+                     mass_c, gravity, tau):
+    """
+    Version of euler_step compiled by get_euler_step, where np.sin and
+    np.cos work on scalars and arrays alike.
+    """
+    return numba_kernel(x_pos, x_vel, angle, angle_vel, np.sin(angle),
+                        np.cos(angle), force, length, mass_p, mass_c, gravity,
+                        tau)
+
+
+def get_euler_step():
+    """
+    Returns euler_step compiled with Numba if it is installed, or euler_step
+    itself otherwise. Numba is only imported, and the kernel only compiled,
+    the first time this is called, when a cart-pole sim world is built, so
+    that other problems never load Numba.
+    """
+    # pylint: disable=global-statement
+    global compiled_euler_step, numba_kernel
+    if compiled_euler_step is not None:
+        return compiled_euler_step
+    try:
+        # pylint: disable=import-outside-toplevel
+        from numba import njit
+    except ImportError:
+        compiled_euler_step = euler_step
+        return compiled_euler_step
+    # Set before numba_euler_step is compiled, which looks it up
+    numba_kernel = njit(cache=True)(euler_step_kernel)
+    compiled_euler_step = njit(cache=True)(numba_euler_step)
+    return compiled_euler_step
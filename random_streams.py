@@ -0,0 +1,97 @@
+"""haakon8855"""
+
+from operator import length_hint
+import numpy as np
+
+
+class RandomStream:
+    """
+    Stream of random numbers from a NumPy Generator, for one consumer such
+    as a sim world or the learner. Uniform floats are drawn in blocks of
+    'block_size' and handed out one at a time, so a single draw in the hot
+    loop costs a step of a list iterator rather than a call into NumPy.
+    Streams spawned from a stream are independent of it and of each other,
+    so every sim world and worker process can have its own while the whole
+    run is still given by one seed. Without a seed, the stream is seeded by
+    the OS.
+    """
+
+    def __init__(self, seed=None, block_size=1024):
+        # The seed is either an integer, None or a SeedSequence spawned
+        # from another stream's
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+        self.block_size = block_size
+        # The current block, and an iterator over the floats of it not yet
+        # handed out
+        self.block = []
+        self.values = iter(self.block)
+
+    def spawn(self, count):
+        """
+        Returns a list of 'count' new streams independent of this one.
+        """
+        return [
+            RandomStream(child, self.block_size)
+            for child in self.seed_sequence.spawn(count)
+        ]
+
+    def random(self):
+        """
+        Returns a uniform float in [0, 1).
+        """
+        try:
+            return next(self.values)
+        except StopIteration:
+            self.block = self.generator.random(self.block_size).tolist()
+            self.values = iter(self.block)
+            return next(self.values)
+
+    def integers(self, low, high):
+        """
+        Returns a uniform integer in [low, high).
+        """
+        return low + int(self.random() * (high - low))
+
+    def uniform(self, low, high):
+        """
+        Returns a uniform float in [low, high).
+        """
+        return low + (high - low) * self.random()
+
+    def get_arrays(self, prefix):
+        """
+        Returns the state of the stream as a dict of arrays, with keys
+        starting with 'prefix', for checkpointing.
+        """
+        state = self.generator.bit_generator.state
+        words = []
+        for value in (state['state']['state'], state['state']['inc']):
+            words += [value >> 64, value & (2**64 - 1)]
+        words += [state['has_uint32'], state['uinteger']]
+        remaining = length_hint(self.values)
+        return {
+            prefix + 'generator': np.array(words, dtype=np.uint64),
+            prefix + 'block': np.array(self.block[len(self.block) -
+                                                  remaining:]),
+        }
+
+    def set_arrays(self, arrays, prefix):
+        """
+        Restores the state of the stream from arrays given by get_arrays.
+        """
+        (state_high, state_low, inc_high, inc_low, has_uint32,
+         uinteger) = arrays[prefix + 'generator'].tolist()
+        self.generator.bit_generator.state = {
+            'bit_generator': 'PCG64',
+            'state': {
+                'state': state_high << 64 | state_low,
+                'inc': inc_high << 64 | inc_low
+            },
+            'has_uint32': has_uint32,
+            'uinteger': uinteger,
+        }
+        self.block = arrays[prefix + 'block'].tolist()
+        self.values = iter(self.block)
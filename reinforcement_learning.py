@@ -1,12 +1,17 @@
 """haakon8855"""
 
-import random
 from time import time
 from math import floor
 import numpy as np
 
-from critic import Critic
-from actor import Actor
+from critic import Critic, LinearCritic
+from actor import Actor, LinearActor
+from state_index import StateIndex
+from replay_buffer import ReplayBuffer
+from checkpoint import Checkpoint
+from frozen_policy import FrozenPolicy
+from sim_world import LegalActionMasks
+from random_streams import RandomStream
 
 
 class ReinforcementLearning:
@@ -27,9 +32,27 @@ class ReinforcementLearning:
                  drate,
                  verbose=False,
                  seed=None,
-                 nn_dims=None):
+                 nn_dims=None,
+                 lazy_traces=False,
+                 nn_epochs=10,
+                 nn_batch_size=32,
+                 replay_capacity=0,
+                 replay_every=1,
+                 replay_schedule='episodes',
+                 replay_batches=10,
+                 critic_backend=None,
+                 tile_coder=None,
+                 vector_sim_world=None,
+                 state_index=None,
+                 rng=None):
         self.episodes = episodes
+        # Number of episodes trained so far, restored when resuming from a
+        # checkpoint
+        self.episode = 0
         self.max_steps = max_steps
+        # A critic backend given by name overrides 'table_critic'
+        if critic_backend is not None:
+            table_critic = critic_backend == 'table'
         self.table_critic = table_critic
         self.epsilon = epsilon
         self.epsilon_d = epsilon / 10
@@ -38,55 +61,394 @@ class ReinforcementLearning:
         self.drate = drate  # gamma
         self.trace_decay = trace_decay  # lambda
         self.verbose = verbose
+        # Stream drawing the exploration decisions, shared with the actor
+        # and critic. The sim worlds draw from their own streams.
+        self.rng = rng if rng is not None else RandomStream(seed)
         # Initialize critic, actor and sim world
         self.sim_world = sim_world
-        self.critic = Critic(table_critic, critic_lrate, drate, trace_decay,
-                             seed, nn_dims)
-        self.actor = Actor(actor_lrate, drate, trace_decay)
+        # States are interned as integer IDs indexing the actor's and the
+        # table based critic's tables, by the given state index if any.
+        self.state_index = state_index
+        if self.state_index is None:
+            self.state_index = StateIndex(sim_world.get_num_states())
+        self.legal_action_masks = LegalActionMasks(sim_world, self.state_index)
+        # If a tile coder is given, the actor and critic are linear in the
+        # active features of the sim world's unrounded observations instead
+        self.tile_coder = tile_coder
+        # If a vector sim world is given, the table based actor and critic
+        # train on all of its sim worlds in lockstep instead of on
+        # 'sim_world', which is then only used for evaluation
+        self.vector_sim_world = vector_sim_world
+        if vector_sim_world is not None and (not table_critic
+                                             or tile_coder is not None):
+            raise Exception(
+                "Batched training is only supported for the table critic")
+        if self.tile_coder is None:
+            self.critic = Critic(table_critic, critic_lrate, drate,
+                                 trace_decay, seed, nn_dims, lazy_traces,
+                                 self.state_index, nn_epochs, nn_batch_size,
+                                 critic_backend, self.rng)
+        else:
+            self.critic = LinearCritic(tile_coder.get_num_features(),
+                                       tile_coder.num_tilings, critic_lrate,
+                                       drate, trace_decay, lazy_traces)
+        # If a replay capacity is given, the NN based critic trains on
+        # mini-batches sampled from a replay buffer of past transitions
+        # every 'replay_every' steps or episodes, as given by
+        # 'replay_schedule', instead of on each episode alone.
+        self.replay_buffer = None
+        self.replay_rng = None
+        if replay_capacity > 0 and not table_critic:
+            self.replay_rng = self.rng.spawn(1)[0]
+            self.replay_buffer = ReplayBuffer(replay_capacity,
+                                              sim_world.get_state_length(),
+                                              self.replay_rng.generator)
+        self.replay_every = replay_every
+        self.replay_schedule = replay_schedule
+        self.replay_batches = replay_batches
+        self.replay_count = 0
+        # Callbacks given the learner and the episode number at the start
+        # and end of every training episode, and the learner, the action and
+        # the reward after every step
+        self.hooks = {'episode_start': [], 'step': [], 'episode_end': []}
+        self.episodes_started = 0
+        # If a HogwildTrainer is attached, training runs in its worker
+        # processes, which share the actor's and critic's tables
+        self.hogwild_trainer = None
+        if self.tile_coder is None:
+            self.actor = Actor(actor_lrate, drate, trace_decay,
+                               sim_world.get_num_actions(), lazy_traces,
+                               self.state_index, self.rng)
+        else:
+            self.actor = LinearActor(tile_coder.get_num_features(),
+                                     tile_coder.num_tilings, actor_lrate,
+                                     drate, trace_decay,
+                                     sim_world.get_num_actions(), lazy_traces,
+                                     self.rng)
 
-    def train(self):
+    def train(self,
+              visualize=True,
+              evaluate=True,
+              metrics_callback=None,
+              checkpoint_file=None,
+              checkpoint_every=100):
         """
-        Runs through episodes in order to train the basic RL model.
+        Runs through episodes in order to train the basic RL model, starting
+        after the episodes already trained if resumed from a checkpoint.
+        Plots the results afterwards if 'visualize' is True, and plays a
+        final greedy episode if 'evaluate' is True. If 'metrics_callback' is
+        given, it is called with a dict of metrics after every episode. If
+        'checkpoint_file' is given, a checkpoint is saved to it every
+        'checkpoint_every' episodes.
         """
         start_time = time()
         train_episode = self.one_episode
-        if not self.table_critic:
+        if self.tile_coder is not None:
+            train_episode = self.one_episode_linear
+        elif not self.table_critic:
             train_episode = self.one_episode_nn
-        # Run for self.episodes number of times, printing progress every 10%
-        if self.episodes % 100 == 0:
-            for j in range(100):
-                for _ in range(self.episodes // 100):
-                    thyme = time()
-                    train_episode()
-                    if self.verbose:
-                        print(f"Secs: {round(time() - thyme, 2)}", end="")
-                        print(f", Steps: {self.sim_world.current_step}")
-                    self.sim_world.store_game_length()
-                if not self.verbose:
-                    print("-", end="")
-                self.decrease_epsilon()
-            end_time = time()
+        if self.vector_sim_world is not None:
+            self.train_batch(metrics_callback, checkpoint_file,
+                             checkpoint_every)
+        elif self.hogwild_trainer is not None:
+            self.hogwild_trainer.train(metrics_callback)
         else:
-            for j in range(self.episodes):
+            # Run for self.episodes number of times, printing progress every
+            # 1%
+            for episode in range(self.episode, self.episodes):
                 thyme = time()
+                for hook in self.hooks['episode_start']:
+                    hook(self, episode)
                 train_episode()
-                if self.verbose:
-                    print(f"Secs: {round(time() - thyme, 2)}", end="")
-                    print(f", Steps: {self.sim_world.current_step}")
-                self.sim_world.store_game_length()
-                if j % floor(self.episodes / 100 + 0.5) == 0:
-                    if not self.verbose:
-                        print("-", end="")
-                    self.decrease_epsilon()
-            end_time = time()
+                self.finish_episode(episode, time() - thyme, metrics_callback)
+                self.advance_episode(episode, checkpoint_file,
+                                     checkpoint_every)
+        end_time = time()
 
         print(f"Time spent training: {end_time-start_time}")
-        self.sim_world.plot_historic_game_length()
+        if visualize:
+            self.sim_world.plot_historic_game_length()
+
+        if evaluate:
+            # Set epsilon to 0 for actual gameplay without exploration
+            self.epsilon = 0
+            train_episode()
+            if visualize:
+                self.sim_world.plot_history_best_episode()
+
+    def advance_episode(self, episode, checkpoint_file, checkpoint_every):
+        """
+        Counts the given episode as trained, decreasing epsilon and saving a
+        checkpoint when due.
+        """
+        self.episode = episode + 1
+        if self.is_epsilon_episode(episode):
+            if not self.verbose:
+                print("-", end="")
+            self.decrease_epsilon()
+        if (checkpoint_file is not None
+                and self.episode % checkpoint_every == 0):
+            self.save_checkpoint(checkpoint_file)
+
+    def train_batch(self,
+                    metrics_callback=None,
+                    checkpoint_file=None,
+                    checkpoint_every=100):
+        """
+        Trains on all sim worlds of the vector sim world in lockstep until
+        the given number of episodes have ended between them. Each step
+        chooses the actions, computes the TD-errors and updates the tables
+        of all sim worlds at once, with every sim world keeping its own
+        eligibility traces. Episodes are counted in the order they end, and
+        step hooks are given arrays of the actions and rewards. Once no
+        more episodes are left to start, sim worlds that finish keep
+        stepping, but their episodes are neither started nor counted.
+        Episodes in progress when a checkpoint is saved are not resumed.
+        """
+        vector_sim_world = self.vector_sim_world
+        num_envs = vector_sim_world.num_envs
+        # Apply the pending updates of lazily decayed traces, as batched
+        # training updates the tables directly
+        self.actor.initiate_eligibility()
+        self.critic.initiate_eligibility()
+        all_envs = np.ones(num_envs, dtype=bool)
+        self.actor.reset_batch_eligibility(all_envs)
+        self.critic.reset_batch_eligibility(all_envs)
+        _, legal_masks = vector_sim_world.produce_initial_state()
+        state_ids = self.get_state_ids(
+            vector_sim_world.get_state_tuples(range(num_envs)))
+        # Whether the episode of each sim world counts towards the episodes
+        active = np.zeros(num_envs, dtype=bool)
+        self.start_batch_episodes(range(num_envs), active)
+        game_lengths = np.zeros(num_envs, dtype=int)
+        start_times = np.full(num_envs, time())
+        step_hooks = self.hooks['step']
+        while self.episode < self.episodes:
+            do_argmax = self.rng.generator.random(num_envs) > self.epsilon
+            actions = self.actor.get_proposed_actions(do_argmax, state_ids,
+                                                      legal_masks)
+            # Finished sim worlds are reset, and their masks are those of
+            # their new initial states
+            (new_states, rewards, dones,
+             legal_masks) = vector_sim_world.step(actions)
+            for hook in step_hooks:
+                hook(self, actions, rewards)
+            new_state_ids = self.get_state_ids(new_states)
+            self.actor.visit_state_actions(state_ids, actions)
+            td_errors = self.critic.get_td_errors(rewards, state_ids,
+                                                  new_state_ids)
+            self.critic.visit_states(state_ids)
+            self.critic.update_batch_state_values(td_errors)
+            self.actor.update_batch_state_action_values(td_errors)
+            game_lengths += 1
+            state_ids = new_state_ids
+            if not dones.any():
+                continue
+            self.actor.reset_batch_eligibility(dones)
+            self.critic.reset_batch_eligibility(dones)
+            done_envs = np.flatnonzero(dones).tolist()
+            state_ids[dones] = self.get_state_ids(
+                vector_sim_world.get_state_tuples(done_envs))
+            now = time()
+            for env in done_envs:
+                if not active[env]:
+                    continue
+                active[env] = False
+                self.finish_episode(self.episode, now - start_times[env],
+                                    metrics_callback, game_lengths[env])
+                self.advance_episode(self.episode, checkpoint_file,
+                                     checkpoint_every)
+            self.start_batch_episodes(done_envs, active)
+            game_lengths[dones] = 0
+            start_times[dones] = now
+
+    def start_batch_episodes(self, envs, active):
+        """
+        Starts the episodes of as many of the given sim worlds as there are
+        episodes left to start in batched training, marking them in the
+        boolean array 'active', and calls the episode start hooks for them,
+        numbered in the order they start.
+        """
+        left = self.episodes - self.episode - np.count_nonzero(active)
+        for env in list(envs)[:max(0, left)]:
+            active[env] = True
+            for hook in self.hooks['episode_start']:
+                hook(self, self.episodes_started)
+            self.episodes_started += 1
+
+    def get_state_ids(self, states):
+        """
+        Returns an array with the ID of each state in the given list.
+        """
+        return np.array([self.state_index.get_id(state) for state in states])
+
+    def add_hook(self, event, hook):
+        """
+        Registers a callback for the given event, either 'episode_start',
+        'step' or 'episode_end'.
+        """
+        if event not in self.hooks:
+            raise Exception(f"Unknown hook event: {event}")
+        self.hooks[event].append(hook)
+
+    def is_epsilon_episode(self, episode):
+        """
+        Returns whether epsilon is decreased after the given episode, which
+        happens 100 times over the course of training.
+        """
+        if self.episodes % 100 == 0:
+            return (episode + 1) % (self.episodes // 100) == 0
+        return episode % max(1, floor(self.episodes / 100 + 0.5)) == 0
+
+    def save_checkpoint(self, path):
+        """
+        Saves the actor's and critic's tables or weights, epsilon, the number
+        of episodes trained, the game length statistics and the RNG states to
+        an .npz-file. Must be called between episodes. The replay buffer,
+        the optimizer state of the NN based critic and TensorFlow's RNG are
+        not saved.
+        """
+        # Apply the pending updates of lazily decayed traces to the tables
+        self.actor.initiate_eligibility()
+        self.critic.initiate_eligibility()
+        arrays = {
+            'episode': np.array(self.episode),
+            'epsilon': np.array(self.epsilon),
+        }
+        arrays.update(
+            self.sim_world.historic_game_length.get_arrays('game_lengths_'))
+        for prefix, rng in self.get_rngs().items():
+            arrays.update(rng.get_arrays(prefix))
+        if self.vector_sim_world is not None:
+            arrays.update(self.vector_sim_world.get_rng_arrays('env_rng_'))
+        if self.tile_coder is not None:
+            arrays['policy'] = self.actor.policy
+            arrays['state_value'] = self.critic.weights
+        else:
+            # Only the rows of the states seen so far are stored
+            num_states = len(self.state_index)
+            arrays['states'] = self.state_index.get_states_array()
+            arrays['policy'] = self.actor.policy[:num_states]
+            if self.table_critic:
+                arrays['state_value'] = self.critic.state_value[:num_states]
+            elif self.critic.state_value_nn.weights is not None:
+                for i, weight in enumerate(self.critic.get_weights()):
+                    arrays[f'nn_weight_{i}'] = weight
+        Checkpoint.save(path, arrays)
+
+    def get_rngs(self):
+        """
+        Returns the random streams of the learner, the sim world, the
+        critic's network and the replay buffer, keyed by the prefix of their
+        arrays in checkpoints. Those of the vector sim world's copies are
+        saved through the vector sim world.
+        """
+        rngs = {'rng_': self.rng, 'sim_world_rng_': self.sim_world.rng}
+        if self.tile_coder is None and self.critic.nn_rng is not None:
+            rngs['nn_rng_'] = self.critic.nn_rng
+        if self.replay_rng is not None:
+            rngs['replay_rng_'] = self.replay_rng
+        return rngs
+
+    def load_checkpoint(self, path):
+        """
+        Restores the state saved by save_checkpoint, so that train continues
+        after the last episode trained before the checkpoint was saved.
+        """
+        arrays = Checkpoint.load(path)
+        self.episode = int(arrays['episode'])
+        self.epsilon = float(arrays['epsilon'])
+        self.sim_world.historic_game_length.set_arrays(arrays, 'game_lengths_')
+        for prefix, rng in self.get_rngs().items():
+            rng.set_arrays(arrays, prefix)
+        if self.vector_sim_world is not None:
+            self.vector_sim_world.set_rng_arrays(arrays, 'env_rng_')
+        if self.tile_coder is not None:
+            self.actor.policy[:] = arrays['policy']
+            self.critic.weights[:] = arrays['state_value']
+        else:
+            self.state_index.set_states(arrays['states'])
+            num_states = len(self.state_index)
+            self.actor.policy[:num_states] = arrays['policy']
+            self.actor.policy[num_states:] = 0
+            if self.table_critic:
+                self.critic.state_value[:num_states] = arrays['state_value']
+                self.critic.state_value[num_states:] = np.nan
+            else:
+                num_weights = sum(
+                    key.startswith('nn_weight_') for key in arrays)
+                if num_weights > 0:
+                    self.critic.set_weights(
+                        [arrays[f'nn_weight_{i}'] for i in range(num_weights)])
+
+    def export_policy(self, path):
+        """
+        Writes the actor's greedy action in every state seen so far to a
+        .npy-file, to be served by FrozenPolicy.
+        """
+        if self.tile_coder is not None:
+            raise Exception("Only table based actors can be exported")
+        # Apply the pending updates of lazily decayed traces to the policy
+        self.actor.initiate_eligibility()
+        FrozenPolicy.export(path, self.actor.policy, self.state_index,
+                            self.sim_world)
 
-        # Set epsilon to 0 for actual gameplay without exploration
-        self.epsilon = 0
-        self.one_episode()
-        self.sim_world.plot_history_best_episode()
+    def finish_episode(self,
+                       episode,
+                       secs,
+                       metrics_callback=None,
+                       game_length=None):
+        """
+        Stores the game length of the finished episode, prints its stats if
+        verbose and reports its metrics to the callback if given. In batched
+        training the game length is given, as the sim world that played the
+        episode has already been reset.
+        """
+        if game_length is None:
+            game_length = self.sim_world.current_step
+            self.sim_world.store_game_length()
+        else:
+            self.sim_world.historic_game_length.append(game_length)
+        if self.verbose:
+            self.print_episode_stats(secs, game_length)
+        for hook in self.hooks['episode_end']:
+            hook(self, episode)
+        if metrics_callback is not None:
+            # Mean game length over the last episodes
+            recent = self.sim_world.historic_game_length.recent.get_values()
+            metrics_callback({
+                'episode': episode,
+                'steps': int(game_length),
+                'secs': secs,
+                'epsilon': self.epsilon,
+                'mean_steps': float(np.mean(recent))
+            })
+
+    def print_episode_stats(self, secs, game_length):
+        """
+        Prints the duration and length of the last episode, and for the NN
+        based critic the time spent training the network versus the
+        overhead around it.
+        """
+        print(f"Secs: {round(secs, 2)}", end="")
+        if not self.table_critic:
+            network = self.critic.state_value_nn
+            print(f", Train: {round(network.train_time, 2)}", end="")
+            print(f", Overhead: {round(network.train_overhead, 2)}", end="")
+        print(f", Steps: {game_length}")
+
+    def warm_start(self, states, state_values, state_action_values):
+        """
+        Initializes the table based critic's values of the given states, and
+        the actor's policy in those states, from arrays with one row per
+        state. Non-finite state-action values, e.g. for illegal actions,
+        are set to 0.
+        """
+        state_ids = [self.state_index.get_id(state) for state in states]
+        if self.table_critic:
+            self.critic.state_value[state_ids] = state_values
+        self.actor.policy[state_ids] = np.where(
+            np.isfinite(state_action_values), state_action_values, 0)
 
     def decrease_epsilon(self):
         """
@@ -100,78 +462,99 @@ class ReinforcementLearning:
         """
         Does one episode.
         """
+        step_hooks = self.hooks['step']
+        # Without a replay buffer, the critic trains on the states and
+        # targets of the episode once it ends
+        track_history = self.replay_buffer is None
         # Init history-tracking lists
         history = []
         target_history = []
         # Start the simworld in its initial state and get a proposed
         # action for that state.
         state = self.sim_world.produce_initial_state()
-        action = self.get_action(state)
+        state_id = self.state_index.get_id(state)
+        action = self.get_action(state, state_id)
         # Reset eligibility
         self.actor.initiate_eligibility()
         # For each step of the episode:
         while True:
             # Do action a from state s:
             reward = self.sim_world.update(action)
+            for hook in step_hooks:
+                hook(self, action, reward)
             new_state = self.sim_world.get_current_state()
+            new_state_id = self.state_index.get_id(new_state)
+            final = self.sim_world.is_current_state_final_state()
+            if self.replay_buffer is not None:
+                self.replay_buffer.add(state, reward, new_state, final)
+                self.replay_tick('steps')
             # Train NN if action a led to a final state
-            if self.sim_world.is_current_state_final_state():
-                history.append((*new_state, 0))
-                states = np.array(history)[:, :-1]
-                target_history.append(0)  # Important to set target to 0
-                self.critic.update_state_values(
-                    states,
-                    np.array(target_history).reshape(-1, 1))
+            if final:
+                if track_history:
+                    history.append((*new_state, 0))
+                    states = np.array(history)[:, :-1]
+                    target_history.append(0)  # Important to set target to 0
+                    self.critic.update_state_values(
+                        states,
+                        np.array(target_history).reshape(-1, 1))
                 break
-            # Append state-action-pair to history
-            history.append((*state, action))
+            if track_history:
+                # Append state-action-pair to history
+                history.append((*state, action))
             # Get the agent's proposed action in the newly reached state
-            proposed_action = self.get_action(new_state)
+            proposed_action = self.get_action(new_state, new_state_id)
             # Set the eligibility for the former state and its action to 1
-            self.actor.set_state_action_eligibility((*state, action), 1)
-            # Calculate the target value and the TD-error
+            self.actor.visit_state_action(state_id, action)
+            # Calculate the target value and the TD-error, which the actor
+            # is updated with
             td_error, target_td = self.critic.get_td_error(
                 reward, state, new_state)
-            # Cache the target value for training of NN after episode ends
-            target_history.append(target_td)
-            # Set the eligibility, doesn't really achieve anything in
-            # the NN-based critic.
-            self.critic.set_state_eligibility(state, 1)
+            if track_history:
+                # Cache the target value for training of NN after episode
+                # ends
+                target_history.append(target_td)
             # Update eligibilities and state-action values for each
             # state-action-pair so far in the episode.
-            for state_action_pair in history:
-                # Get a state and an action
-                state = state_action_pair[:-1]
-                action = state_action_pair[-1]
-                # Update state eligibility
-                self.critic.update_state_eligibility(state)
-                # Update state-action value (policy)
-                self.actor.update_state_action_value(state_action_pair,
-                                                     td_error)
-                # Update state-action eligibility
-                self.actor.update_state_action_eligibility(state_action_pair)
+            self.actor.update_state_action_values(td_error)
             # Update the current state and action
             state = new_state
+            state_id = new_state_id
             action = proposed_action
             # Check if state is final or failed state
             if (self.sim_world.is_current_state_failed_state()
                     or self.sim_world.is_current_state_final_state()):
                 # Code reaches this block if timeout is reached
-                states = np.array(history)[:, :-1]
-                targets = np.array(target_history).reshape(-1, 1)
-                self.critic.update_state_values(states, targets)
+                if track_history:
+                    states = np.array(history)[:, :-1]
+                    targets = np.array(target_history).reshape(-1, 1)
+                    self.critic.update_state_values(states, targets)
                 break
+        if not track_history:
+            self.replay_tick('episodes')
+
+    def replay_tick(self, schedule):
+        """
+        Counts one step or episode of the given schedule, and trains the
+        critic from the replay buffer when 'replay_every' of them have
+        passed on the configured schedule.
+        """
+        if schedule != self.replay_schedule:
+            return
+        self.replay_count += 1
+        if self.replay_count % self.replay_every == 0:
+            self.critic.train_from_replay(self.replay_buffer,
+                                          self.replay_batches)
 
     def one_episode(self):
         """
         Does one episode.
         """
-        # Init history-tracking list
-        history = []
+        step_hooks = self.hooks['step']
         # Start the simworld in its initial state and get a proposed
         # action for that state.
         state = self.sim_world.produce_initial_state()
-        action = self.get_action(state)
+        state_id = self.state_index.get_id(state)
+        action = self.get_action(state, state_id)
         # Reset eligibility
         self.actor.initiate_eligibility()
         self.critic.initiate_eligibility()
@@ -180,46 +563,90 @@ class ReinforcementLearning:
         while not end_state:
             # Do action a from state s:
             reward = self.sim_world.update(action)
+            for hook in step_hooks:
+                hook(self, action, reward)
             new_state = self.sim_world.get_current_state()
-            # Store state-action-pair in history
-            history.append((*state, action))
+            new_state_id = self.state_index.get_id(new_state)
             # Get a proposed action for the new state
-            proposed_action = self.get_action(new_state)
+            proposed_action = self.get_action(new_state, new_state_id)
             # Set the eligibility of former state and its action to 1
-            self.actor.set_state_action_eligibility((*state, action), 1)
+            self.actor.visit_state_action(state_id, action)
             # Calculate TD-error and target-value. Latter not used in
             # table-based critic.
-            td_error, _ = self.critic.get_td_error(reward, state, new_state)
+            td_error, _ = self.critic.get_td_error(reward, state_id,
+                                                   new_state_id)
             # Set the critic's state eligibility to 1
-            self.critic.set_state_eligibility(state, 1)
-            # Update eligibilities and state-action values for each
-            # state-action-pair so far in the episode.
-            for state_action_pair in history:
-                # Fetch a state and action from the state-action-pair
-                state = state_action_pair[:-1]
-                action = state_action_pair[-1]
-                # Update eligibilities and values for critic and actor
-                self.critic.update_state_value(state, td_error)
-                self.critic.update_state_eligibility(state)
-                self.actor.update_state_action_value(state_action_pair,
-                                                     td_error)
-                self.actor.update_state_action_eligibility(state_action_pair)
+            self.critic.visit_state(state_id)
+            # Update eligibilities and values for every state and
+            # state-action-pair visited so far in the episode.
+            self.critic.update_traced_state_values(td_error)
+            self.actor.update_state_action_values(td_error)
             # Update the current state and action
-            state = new_state
+            state_id = new_state_id
             action = proposed_action
             # Check if state is final or failed state
             if (self.sim_world.is_current_state_failed_state()
                     or self.sim_world.is_current_state_final_state()):
                 end_state = True
 
-    def get_action(self, state):
+    def one_episode_linear(self):
         """
-        Returns an action given a state by consulting the actor
+        Does one episode with the linear actor and critic, where states are
+        given by the active features of the sim world's observations.
         """
+        step_hooks = self.hooks['step']
+        # Start the simworld in its initial state and get a proposed
+        # action for that state.
+        self.sim_world.produce_initial_state()
+        observation = self.sim_world.get_observation()
+        features = self.tile_coder.get_active_features(observation)
+        action = self.get_action(observation, features)
+        # Reset eligibility
+        self.actor.initiate_eligibility()
+        self.critic.initiate_eligibility()
+        # For each step of the episode:
+        end_state = False
+        while not end_state:
+            # Do action a from state s:
+            reward = self.sim_world.update(action)
+            for hook in step_hooks:
+                hook(self, action, reward)
+            new_observation = self.sim_world.get_observation()
+            new_features = self.tile_coder.get_active_features(
+                new_observation)
+            # Get a proposed action for the new state
+            proposed_action = self.get_action(new_observation, new_features)
+            # Set the eligibility of former state's features and the action
+            # to 1
+            self.actor.visit_state_action(features, action)
+            td_error, _ = self.critic.get_td_error(reward, features,
+                                                   new_features)
+            self.critic.visit_state(features)
+            # Update eligibilities and weights for every feature and
+            # feature-action-pair visited so far in the episode.
+            self.critic.update_traced_state_values(td_error)
+            self.actor.update_state_action_values(td_error)
+            # Update the current state and action
+            features = new_features
+            action = proposed_action
+            # Check if state is final or failed state
+            if (self.sim_world.is_current_state_failed_state()
+                    or self.sim_world.is_current_state_final_state()):
+                end_state = True
+
+    def get_action(self, state, state_id=None):
+        """
+        Returns an action given a state by consulting the actor. With a
+        tile coder, 'state_id' must be the state's active features.
+        """
+        if state_id is None:
+            state_id = self.state_index.get_id(state)
         # In an epsilon-greedy strategy, do a purely random action if
         # a generated random number in the range (0, 1) is less than epsilon.
         # Otherwise pick the action that yields the greates policy value.
-        do_argmax = random.random() > self.epsilon
-        possible_actions = self.sim_world.get_legal_actions(state)
-        return self.actor.get_proposed_action(do_argmax, state,
-                                              possible_actions)
+        do_argmax = self.rng.random() > self.epsilon
+        if self.tile_coder is None:
+            legal_mask = self.legal_action_masks.get_mask(state, state_id)
+        else:
+            legal_mask = self.sim_world.get_legal_action_mask(state)
+        return self.actor.get_proposed_action(do_argmax, state_id, legal_mask)
@@ -0,0 +1,45 @@
+"""haakon8855"""
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of (state, reward, next_state, done)
+    transitions stored in NumPy arrays. When full, the oldest transitions
+    are overwritten. Mini-batches are drawn from the NumPy Generator 'rng'.
+    """
+
+    def __init__(self, capacity, state_length, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_length), dtype=np.float32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_length), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.size = 0
+
+    def add(self, state, reward, next_state, done):
+        """
+        Stores one transition, where 'done' tells whether 'next_state' is a
+        final state.
+        """
+        self.states[self.position] = state
+        self.rewards[self.position] = reward
+        self.next_states[self.position] = next_state
+        self.dones[self.position] = done
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        """
+        Returns a mini-batch of transitions drawn uniformly with replacement
+        as the arrays (states, rewards, next_states, dones).
+        """
+        indexes = self.rng.integers(0, self.size, batch_size)
+        return (self.states[indexes], self.rewards[indexes],
+                self.next_states[indexes], self.dones[indexes])
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,146 @@
+"""haakon8855"""
+
+import numpy as np
+
+from state_index import StateIndex
+
+
+class SimWorld:
+    """
+    Base class of the simulated worlds, defining the interface the
+    reinforcement learner and VectorSimWorld play them through.
+
+    A sim world holds the state of one episode at a time. States are
+    returned as tuples encoding them, e.g. one-hot-encoded, and actions are
+    integers (or booleans) in range(get_num_actions()). Random numbers are
+    drawn from the sim world's own RandomStream 'rng'.
+    """
+
+    def produce_initial_state(self):
+        """
+        Starts a new episode and returns its initial state.
+        """
+        raise NotImplementedError
+
+    def update(self, action):
+        """
+        Performs the given action in the current state and returns the
+        reward.
+        """
+        raise NotImplementedError
+
+    def get_current_state(self):
+        """
+        Returns the encoding of the current state.
+        """
+        raise NotImplementedError
+
+    def get_legal_actions(self, state=None):
+        """
+        Returns the legal actions in the given state, or in the current state
+        if no state is given.
+        """
+        raise NotImplementedError
+
+    def is_current_state_final_state(self):
+        """
+        Returns whether the episode has been won.
+        """
+        raise NotImplementedError
+
+    def is_current_state_failed_state(self):
+        """
+        Returns whether the episode has been lost, e.g. by timing out.
+        """
+        raise NotImplementedError
+
+    def store_game_length(self):
+        """
+        Stores the length of the current episode in historic_game_length.
+        """
+        raise NotImplementedError
+
+    def get_state_length(self):
+        """
+        Returns the length of the state encoding.
+        """
+        raise NotImplementedError
+
+    def get_num_states(self):
+        """
+        Returns the number of distinct states, or None if not known.
+        """
+        return None
+
+    def get_num_actions(self):
+        """
+        Returns the number of distinct actions over all states.
+        """
+        raise NotImplementedError
+
+    def get_state_number(self, state):
+        """
+        Returns a number in range(get_num_states()) identifying the given
+        state, the same in every process.
+        """
+        raise NotImplementedError
+
+    def plot_historic_game_length(self):
+        """
+        Plots the length of every episode played.
+        """
+        raise NotImplementedError
+
+    def plot_history_best_episode(self):
+        """
+        Plots or animates the best episode played.
+        """
+        raise NotImplementedError
+
+    def is_episode_over(self):
+        """
+        Returns whether the current episode has ended, by winning or losing.
+        """
+        return (self.is_current_state_final_state()
+                or self.is_current_state_failed_state())
+
+    def get_legal_action_mask(self, state=None):
+        """
+        Returns a boolean array over all actions marking those legal in the
+        given state, or in the current state if no state is given.
+        """
+        mask = np.zeros(self.get_num_actions(), dtype=bool)
+        mask[np.array(self.get_legal_actions(state), dtype=int)] = True
+        return mask
+
+
+class LegalActionMasks:
+    """
+    Cache of the legal-action mask of every state, indexed by state ID, so
+    that a sim world only computes the mask of a state the first time the
+    state is seen.
+    """
+
+    def __init__(self, sim_world, state_index):
+        self.sim_world = sim_world
+        self.masks = np.zeros(
+            (state_index.capacity, sim_world.get_num_actions()), dtype=bool)
+        # Whether the mask of each state ID has been computed
+        self.known = np.zeros(state_index.capacity, dtype=bool)
+        state_index.add_listener(self.grow)
+
+    def get_mask(self, state, state_id):
+        """
+        Returns the legal-action mask of the given state with the given ID.
+        """
+        if not self.known[state_id]:
+            self.masks[state_id] = self.sim_world.get_legal_action_mask(state)
+            self.known[state_id] = True
+        return self.masks[state_id]
+
+    def grow(self, capacity):
+        """
+        Grows the cache to hold the given number of states.
+        """
+        self.masks = StateIndex.resize_table(self.masks, capacity, False)
+        self.known = StateIndex.resize_table(self.known, capacity, False)
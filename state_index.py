@@ -0,0 +1,116 @@
+"""haakon8855"""
+
+import numpy as np
+
+
+class StateIndex:
+    """
+    Interns the states of a sim world as compact integer IDs, so that tables
+    indexed by state can be stored as contiguous NumPy arrays.
+    """
+
+    def __init__(self, num_states=None, capacity=64):
+        self.ids = {}
+        self.states = []
+        # If the size of the state space is not known up front, the tables
+        # start out at the given capacity and grow as new states are seen.
+        self.capacity = capacity
+        if num_states is not None:
+            self.capacity = num_states
+        self.listeners = []
+
+    def get_id(self, state):
+        """
+        Returns the integer ID of the given state, assigning the next free ID
+        if the state has not been seen before.
+        """
+        state_id = self.ids.get(state)
+        if state_id is None:
+            state_id = len(self.states)
+            self.ids[state] = state_id
+            self.states.append(state)
+            if state_id >= self.capacity:
+                self.grow()
+        return state_id
+
+    def get_state(self, state_id):
+        """
+        Returns the state with the given integer ID.
+        """
+        return self.states[state_id]
+
+    def add_listener(self, listener):
+        """
+        Registers a function to be called with the new capacity whenever the
+        capacity grows.
+        """
+        self.listeners.append(listener)
+
+    def grow(self):
+        """
+        Doubles the capacity and notifies the listeners.
+        """
+        self.capacity *= 2
+        for listener in self.listeners:
+            listener(self.capacity)
+
+    def get_states_array(self):
+        """
+        Returns the states seen so far as an array with one row per state ID,
+        using single bytes if the states are small non-negative integers such
+        as one-hot encodings.
+        """
+        states = np.array(self.states)
+        if states.size > 0 and states.min() >= 0 and states.max() <= 255:
+            states = states.astype(np.uint8)
+        return states
+
+    def set_states(self, states):
+        """
+        Replaces the states seen so far with the rows of the given array,
+        where the row number is the state ID, growing the capacity if
+        needed.
+        """
+        self.states = [tuple(state) for state in states.tolist()]
+        self.ids = {state: i for i, state in enumerate(self.states)}
+        while len(self.states) > self.capacity:
+            self.grow()
+
+    def __len__(self):
+        return len(self.states)
+
+    @staticmethod
+    def resize_table(table, capacity, fill_value):
+        """
+        Returns a copy of the given table with its first axis extended to
+        the given capacity, filling new rows with 'fill_value'.
+        """
+        new_table = np.full((capacity, *table.shape[1:]),
+                            fill_value,
+                            dtype=table.dtype)
+        new_table[:len(table)] = table
+        return new_table
+
+
+class NumberedStateIndex(StateIndex):
+    """
+    State index whose IDs are the numbers the sim world gives its states
+    rather than the order in which states are first seen, so that processes
+    sharing tables agree on them. The capacity is the number of states, so
+    tables indexed by it never grow. States are not stored, so the index can
+    not be saved or give the state of an ID.
+    """
+
+    def __init__(self, sim_world):
+        super().__init__(sim_world.get_num_states())
+        self.get_state_number = sim_world.get_state_number
+
+    def get_id(self, state):
+        """
+        Returns the number of the given state.
+        """
+        state_id = self.ids.get(state)
+        if state_id is None:
+            state_id = self.get_state_number(state)
+            self.ids[state] = state_id
+        return state_id
@@ -0,0 +1,145 @@
+"""haakon8855"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from time import time
+import numpy as np
+
+from configuration import Config
+from gprl_system import GPRLSystem
+
+
+class Sweep:
+    """
+    Runs a configuration many times with different parameters and seeds,
+    spreading the runs across a pool of worker processes.
+
+    The sweep spec is an .ini-file with a GRID section, where each parameter
+    lists the values to try, and/or a RANDOM section, where each parameter
+    gives a [low, high] range to sample uniformly from and 'samples' tells
+    how many points to draw. Every grid point is combined with every random
+    sample, and each combination is run once per seed.
+    """
+
+    def __init__(self, config_file: str, spec_file: str, seeds=1, seed=0):
+        self.config_file = config_file
+        spec = Config.get_config(spec_file)
+        self.grid = {}
+        if 'GRID' in spec:
+            for key, values in spec['GRID'].items():
+                self.grid[key] = json.loads(values)
+        self.ranges = {}
+        self.samples = 1
+        if 'RANDOM' in spec:
+            for key, value in spec['RANDOM'].items():
+                if key == 'samples':
+                    self.samples = int(value)
+                else:
+                    self.ranges[key] = json.loads(value)
+        self.seeds = seeds
+        self.seed = seed
+
+    def get_runs(self):
+        """
+        Returns a list of (overrides, seed) for every run in the sweep.
+        """
+        rng = random.Random(self.seed)
+        # Every run gets its own seed spawned from the sweep's seed
+        seed_sequences = np.random.SeedSequence(self.seed)
+        keys = list(self.grid)
+        runs = []
+        for values in itertools.product(*self.grid.values()):
+            for _ in range(self.samples):
+                params = dict(zip(keys, values))
+                for key, (low, high) in self.ranges.items():
+                    params[key] = rng.uniform(low, high)
+                for child in seed_sequences.spawn(self.seeds):
+                    runs.append((params, int(child.generate_state(1)[0])))
+        return runs
+
+    def run(self, workers=None, output='sweep_results.csv'):
+        """
+        Runs the sweep using the given number of worker processes, or one per
+        core if not given, and writes one row per run to 'output'.
+        """
+        runs = self.get_runs()
+        if workers is None:
+            workers = os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(run_once, self.config_file, params, seed)
+                for params, seed in runs
+            ]
+            results = []
+            for i, future in enumerate(futures):
+                results.append(future.result())
+                print(f"Run {i + 1}/{len(runs)}: "
+                      f"{round(results[-1]['seconds'], 2)} secs")
+        Sweep.write_results(results, output)
+        return results
+
+    @staticmethod
+    def write_results(results, output):
+        """
+        Writes the results of the runs to a csv-file, one row per run. The
+        downsampled game lengths are stored as a json-list.
+        """
+        fields = list(results[0])
+        with open(output, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            for result in results:
+                row = dict(result)
+                row['game_lengths'] = json.dumps(row['game_lengths'])
+                writer.writerow(row)
+
+
+def run_once(config_file, params, seed):
+    """
+    Trains on the given config with the given parameter overrides and seed,
+    without any plotting or printing. Returns the results of the run.
+    """
+    overrides = dict(params, seed=seed, verbose='false', evaluate='false')
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with redirect_stdout(devnull):
+            start_time = time()
+            gprl = GPRLSystem(config_file, overrides, visualize=False)
+            gprl.run()
+            seconds = time() - start_time
+    game_lengths = gprl.sim_world.historic_game_length
+    return dict(params,
+                seed=seed,
+                seconds=seconds,
+                mean_game_length=game_lengths.get_mean(),
+                game_lengths=game_lengths.history.get_values()[1].tolist())
+
+
+def main():
+    """
+    Main function for running a sweep from the command line.
+    """
+    parser = argparse.ArgumentParser(description=Sweep.__doc__)
+    parser.add_argument('config', help='config file to sweep over')
+    parser.add_argument('spec', help='sweep spec with GRID/RANDOM sections')
+    parser.add_argument('--seeds', type=int, default=1,
+                        help='number of seeds to run for every parameter set')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for sampling parameters and run seeds')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes, default one per '
+                        'core')
+    parser.add_argument('--output', default='sweep_results.csv',
+                        help='csv-file to write the results to')
+    args = parser.parse_args()
+    sweep = Sweep(args.config, args.spec, args.seeds, args.seed)
+    sweep.run(args.workers, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""haakon8855"""
+
+import os
+import sys
+
+# The modules live in the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+"""haakon8855"""
+
+import os
+from contextlib import redirect_stdout
+
+from gprl_system import GPRLSystem
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'configs', 'config_gambler.ini')
+
+
+def test_as_many_episodes_start_as_end():
+    overrides = {
+        'episodes': 37,
+        'seed': 0,
+        'num_envs': 8,
+        'verbose': 'false',
+        'evaluate': 'false'
+    }
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with redirect_stdout(devnull):
+            gprl = GPRLSystem(CONFIG, overrides, visualize=False)
+            learner = gprl.reinforcement_learner
+            starts = []
+            ends = []
+            learner.add_hook('episode_start',
+                             lambda _, episode: starts.append(episode))
+            learner.add_hook('episode_end',
+                             lambda _, episode: ends.append(episode))
+            gprl.train()
+    assert starts == list(range(37))
+    assert ends == list(range(37))
@@ -0,0 +1,53 @@
+"""haakon8855"""
+
+import os
+from contextlib import redirect_stdout
+
+import pytest
+
+from gprl_system import GPRLSystem
+from instrumentation import PhaseTimers
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'configs', 'config_gambler.ini')
+OVERRIDES = {
+    'episodes': 20,
+    'seed': 0,
+    'num_workers': 2,
+    'verbose': 'false',
+    'evaluate': 'false'
+}
+
+
+def make_system(**overrides):
+    """
+    Returns a system training the gambler problem in two worker processes.
+    """
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with redirect_stdout(devnull):
+            return GPRLSystem(CONFIG, dict(OVERRIDES, **overrides),
+                              visualize=False)
+
+
+def test_episode_end_hooks_are_called():
+    gprl = make_system()
+    ends = []
+    gprl.reinforcement_learner.add_hook(
+        'episode_end', lambda _, episode: ends.append(episode))
+    gprl.train()
+    assert ends == list(range(20))
+
+
+@pytest.mark.parametrize('event', ['episode_start', 'step'])
+def test_worker_hooks_are_refused(event):
+    gprl = make_system()
+    gprl.reinforcement_learner.add_hook(event, lambda *_: None)
+    with pytest.raises(Exception, match='hooks are not supported'):
+        gprl.train()
+
+
+def test_phase_timers_are_refused():
+    with pytest.raises(Exception, match='phase timers'):
+        make_system(phase_timers=1)
+    with pytest.raises(Exception, match='Phase timers'):
+        PhaseTimers().attach(make_system().reinforcement_learner)
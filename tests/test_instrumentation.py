@@ -0,0 +1,32 @@
+"""haakon8855"""
+
+import os
+from contextlib import redirect_stdout
+
+from gprl_system import GPRLSystem
+from instrumentation import PhaseTimers
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'configs', 'config_gambler.ini')
+
+
+def test_phases_are_timed_in_batched_training():
+    overrides = {
+        'episodes': 50,
+        'seed': 0,
+        'num_envs': 4,
+        'verbose': 'false',
+        'evaluate': 'false'
+    }
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with redirect_stdout(devnull):
+            gprl = GPRLSystem(CONFIG, overrides, visualize=False)
+            timers = PhaseTimers()
+            timers.attach(gprl.reinforcement_learner)
+            gprl.train()
+            timers.detach()
+    report = timers.get_report()
+    for phase in ('env_update', 'encode', 'get_action', 'td_error',
+                  'traces'):
+        assert report[phase]['calls'] > 0
+        assert report[phase]['secs'] > 0
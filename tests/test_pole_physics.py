@@ -0,0 +1,56 @@
+"""haakon8855"""
+
+import numpy as np
+
+from pole_physics import euler_step, get_euler_step
+
+# length, mass_p, mass_c, gravity, tau as in PoleBalancing
+CONSTANTS = (0.5, 0.1, 1, -9.8, 0.02)
+
+
+def reference_step(x_pos, x_vel, angle, angle_vel, force, length, mass_p,
+                   mass_c, gravity, tau):
+    """
+    The scalar equations PoleBalancing used before pole_physics, from its
+    get_child_state, update_angle_acc and update_x_acc.
+    """
+    numerator_fraction = (np.cos(angle) *
+                          (-force - mass_p * length *
+                           (angle_vel**2) * np.sin(angle))) / (mass_p + mass_c)
+    numerator = gravity * np.sin(angle) + numerator_fraction
+    denominator = length * (4 / 3 - (mass_p * (np.cos(angle)**2)) /
+                            (mass_p + mass_c))
+    angle_acc = numerator / denominator
+    x_acc = (force + mass_p * length *
+             ((angle_vel**2) * np.sin(angle) - angle_acc * np.cos(angle))) / (
+                 mass_p + mass_c)
+    return (x_pos + tau * x_vel, x_vel + tau * x_acc, angle + tau * angle_vel,
+            angle_vel + tau * angle_acc)
+
+
+def random_states(count=1000):
+    """
+    Returns arrays of random x_pos, x_vel, angle, angle_vel and forces.
+    """
+    rng = np.random.default_rng(0)
+    return (rng.uniform(-2.4, 2.4, count), rng.uniform(-3, 3, count),
+            rng.uniform(-0.21, 0.21, count), rng.uniform(-3, 3, count),
+            rng.choice([-10.0, 10.0], count))
+
+
+def test_scalar_steps_match_reference_bit_for_bit():
+    for step in (euler_step, get_euler_step()):
+        for state in zip(*(array.tolist() for array in random_states())):
+            assert step(*state, *CONSTANTS) == reference_step(
+                *state, *CONSTANTS)
+
+
+def test_array_steps_match_reference_bit_for_bit():
+    states = random_states()
+    expected = [
+        reference_step(*state, *CONSTANTS)
+        for state in zip(*(array.tolist() for array in states))
+    ]
+    for step in (euler_step, get_euler_step()):
+        result = np.column_stack(step(*states, *CONSTANTS))
+        assert np.array_equal(result, np.array(expected))
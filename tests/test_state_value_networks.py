@@ -0,0 +1,33 @@
+"""haakon8855"""
+
+import numpy as np
+import pytest
+
+from numpy_critic import NumpyStateValueNetwork
+
+
+def initial_weights(network):
+    """
+    Builds the network on a block of states and returns its weights.
+    """
+    network.get_state_values(np.zeros((1, 20)))
+    return [weight for layer in network.weights for weight in layer]
+
+
+def assert_same_initial_weights(network_class):
+    first = initial_weights(network_class([50, 1], 0.01, seed=3))
+    second = initial_weights(network_class([50, 1], 0.01, seed=3))
+    other = initial_weights(network_class([50, 1], 0.01, seed=4))
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not np.array_equal(first[0], other[0])
+
+
+def test_numpy_network_initial_weights_are_seeded():
+    assert_same_initial_weights(NumpyStateValueNetwork)
+
+
+def test_keras_network_initial_weights_are_seeded():
+    pytest.importorskip('tensorflow')
+    # pylint: disable=import-outside-toplevel
+    from keras_critic import KerasStateValueNetwork
+    assert_same_initial_weights(KerasStateValueNetwork)
@@ -0,0 +1,51 @@
+"""haakon8855"""
+
+import numpy as np
+
+
+class TileCoder:
+    """
+    Encodes a continuous observation as the indexes of its active features
+    in a set of overlapping tilings.
+
+    Each tiling splits every dimension of the observation into
+    'tiles_per_dim' tiles, and is offset from the others by a fraction of a
+    tile, so exactly one tile per tiling is active for any observation.
+    Values outside [lows, highs] are clipped to the nearest tile.
+    """
+
+    def __init__(self, lows, highs, num_tilings=8, tiles_per_dim=8):
+        self.lows = np.asarray(lows, dtype=float)
+        self.highs = np.asarray(highs, dtype=float)
+        self.num_tilings = num_tilings
+        self.tiles_per_dim = tiles_per_dim
+        dims = len(self.lows)
+        # Tilings are offset asymmetrically along the odd displacement vector
+        # (1, 3, 5, ...), which spreads them more evenly than offsetting
+        # every dimension by the same amount.
+        displacement = np.arange(1, 2 * dims, 2)
+        self.offsets = (np.arange(num_tilings)[:, None] * displacement /
+                        num_tilings) % 1
+        # The offsets shift the tiles, so each tiling needs one extra tile
+        # per dimension to cover the whole range.
+        tiles = tiles_per_dim + 1
+        self.tiles_per_tiling = tiles**dims
+        self.strides = tiles**np.arange(dims)
+        self.tiling_starts = np.arange(num_tilings) * self.tiles_per_tiling
+        self.scale = tiles_per_dim / (self.highs - self.lows)
+
+    def get_num_features(self):
+        """
+        Returns the total number of features over all tilings.
+        """
+        return self.num_tilings * self.tiles_per_tiling
+
+    def get_active_features(self, observation):
+        """
+        Returns an array with the index of the active feature in each
+        tiling for the given observation.
+        """
+        scaled = np.clip((np.asarray(observation) - self.lows) * self.scale,
+                         0, self.tiles_per_dim - 1e-9)
+        coords = (scaled + self.offsets).astype(int)
+        return self.tiling_starts + coords @ self.strides
@@ -0,0 +1,300 @@
+"""haakon8855"""
+
+import multiprocessing
+import os
+import numpy as np
+
+from episode_metrics import EpisodeStats
+from random_streams import RandomStream
+
+
+class VectorSimWorld:
+    """
+    Steps N copies of a sim world in lockstep within this process.
+
+    States, rewards, episode ends and legal-action masks are returned as
+    arrays with one row per sim world. Sim worlds whose episode ends are
+    reset automatically, as in BatchPoleBalancing, so every call to update
+    advances all of them. Every sim world is given its own stream spawned
+    from 'rng', which 'make_sim_world' takes as its 'rng' keyword.
+    """
+
+    def __init__(self, make_sim_world, num_envs, rng=None):
+        self.num_envs = num_envs
+        if rng is None:
+            rng = RandomStream()
+        self.sim_worlds = [
+            make_sim_world(rng=stream) for stream in rng.spawn(num_envs)
+        ]
+        self.historic_game_length = EpisodeStats()
+        # Lengths of the episodes that ended in the last update
+        self.last_game_lengths = []
+
+    def produce_initial_state(self):
+        """
+        Starts a new episode in every sim world. Returns the initial states
+        and their legal-action masks.
+        """
+        states = [sim_world.produce_initial_state()
+                  for sim_world in self.sim_worlds]
+        return np.array(states), self.get_legal_action_masks()
+
+    def update(self, actions):
+        """
+        Performs the given action, one per sim world, in each sim world.
+        Returns the reached states, the rewards, a boolean array marking the
+        sim worlds whose episode ended, and the legal-action masks of the
+        current states. Sim worlds whose episode ended are reset after their
+        reached states are recorded, so get_current_state and the masks
+        give their new initial states.
+        """
+        states, rewards, dones, legal_masks = self.step(actions)
+        return np.array(states), rewards, dones, legal_masks
+
+    def step(self, actions):
+        """
+        Same as update, but returns the reached states as a list of the
+        sim worlds' state tuples, which is much cheaper than building an
+        array of them when they are only looked up.
+        """
+        states = []
+        rewards = np.zeros(self.num_envs)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        self.last_game_lengths = []
+        for i, (sim_world, action) in enumerate(
+                zip(self.sim_worlds, np.asarray(actions).tolist())):
+            rewards[i] = sim_world.update(action)
+            states.append(sim_world.get_current_state())
+            if sim_world.is_episode_over():
+                dones[i] = True
+                self.last_game_lengths.append(sim_world.current_step)
+                sim_world.produce_initial_state()
+        self.historic_game_length.extend(self.last_game_lengths)
+        return states, rewards, dones, self.get_legal_action_masks()
+
+    def get_current_state(self):
+        """
+        Returns the current states of all sim worlds, one row per sim world.
+        """
+        return np.array(
+            [sim_world.get_current_state() for sim_world in self.sim_worlds])
+
+    def get_state_tuples(self, indexes):
+        """
+        Returns a list of the current states of the sim worlds with the
+        given indexes.
+        """
+        return [self.sim_worlds[i].get_current_state() for i in indexes]
+
+    def get_legal_action_masks(self):
+        """
+        Returns a boolean array with one row per sim world marking the legal
+        actions in its current state.
+        """
+        return np.array([
+            sim_world.get_legal_action_mask()
+            for sim_world in self.sim_worlds
+        ])
+
+    def get_num_actions(self):
+        """
+        Returns the number of distinct actions of the sim worlds.
+        """
+        return self.sim_worlds[0].get_num_actions()
+
+    def get_rng_arrays(self, prefix, first=0):
+        """
+        Returns the states of the sim worlds' random streams as a dict of
+        arrays for checkpointing, with keys starting with 'prefix' and the
+        number of the sim world, counting from 'first'.
+        """
+        arrays = {}
+        for i, sim_world in enumerate(self.sim_worlds, first):
+            arrays.update(sim_world.rng.get_arrays(f'{prefix}{i}_'))
+        return arrays
+
+    def set_rng_arrays(self, arrays, prefix, first=0):
+        """
+        Restores the sim worlds' random streams from arrays given by
+        get_rng_arrays.
+        """
+        for i, sim_world in enumerate(self.sim_worlds, first):
+            sim_world.rng.set_arrays(arrays, f'{prefix}{i}_')
+
+    def close(self):
+        """
+        Releases the resources held, which is nothing in this process.
+        """
+
+
+class AsyncVectorSimWorld:
+    """
+    Steps N copies of a sim world in lockstep, spread over worker
+    processes, with the same methods as VectorSimWorld. The sim worlds
+    themselves live in the workers, so there is no 'sim_worlds' list.
+
+    Each worker steps its share of the sim worlds with a VectorSimWorld
+    while the others do the same, so the time of one update is that of the
+    slowest worker. 'make_sim_world' must be picklable, e.g. a class or a
+    functools.partial, when processes are not forked. Every worker draws
+    its random numbers from its own stream spawned from 'seed', which is
+    seeded by the OS if no seed is given, so that the workers do not play
+    the same episodes.
+    """
+
+    def __init__(self, make_sim_world, num_envs, num_workers=None, seed=None):
+        self.num_envs = num_envs
+        if num_workers is None:
+            num_workers = min(num_envs, os.cpu_count())
+        sizes = [len(part) for part in np.array_split(range(num_envs),
+                                                      num_workers)]
+        # Index of the first sim world of each worker after the first
+        self.bounds = np.cumsum(sizes)[:-1]
+        self.firsts = [0, *self.bounds.tolist()]
+        seeds = np.random.SeedSequence(seed).spawn(num_workers)
+        self.historic_game_length = EpisodeStats()
+        self.pipes = []
+        self.workers = []
+        context = multiprocessing.get_context()
+        for size, worker_seed in zip(sizes, seeds):
+            pipe, worker_pipe = context.Pipe()
+            worker = context.Process(target=run_worker,
+                                     args=(worker_pipe, make_sim_world, size,
+                                           worker_seed),
+                                     daemon=True)
+            worker.start()
+            worker_pipe.close()
+            self.pipes.append(pipe)
+            self.workers.append(worker)
+        self.num_actions = self.call('get_num_actions')[0]
+
+    def call(self, command, parts=None):
+        """
+        Sends the command, along with its part of 'parts' if given, to every
+        worker and returns their results in order. Errors raised in a
+        worker are raised here.
+        """
+        if parts is None:
+            parts = [None] * len(self.pipes)
+        for pipe, part in zip(self.pipes, parts):
+            pipe.send((command, part))
+        results = [pipe.recv() for pipe in self.pipes]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def produce_initial_state(self):
+        """
+        Starts a new episode in every sim world. Returns the initial states
+        and their legal-action masks.
+        """
+        results = self.call('produce_initial_state')
+        return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+    def update(self, actions):
+        """
+        Performs the given action, one per sim world, in each sim world. See
+        VectorSimWorld.update.
+        """
+        states, rewards, dones, legal_masks = self.step(actions)
+        return np.array(states), rewards, dones, legal_masks
+
+    def step(self, actions):
+        """
+        Same as update, but returns the reached states as a list of the
+        sim worlds' state tuples. See VectorSimWorld.step.
+        """
+        results = self.call('step', np.split(np.asarray(actions),
+                                             self.bounds))
+        for *_, game_lengths in results:
+            self.historic_game_length.extend(game_lengths)
+        states = [state for result in results for state in result[0]]
+        return (states, *(np.concatenate(arrays)
+                          for arrays in list(zip(*results))[1:-1]))
+
+    def get_current_state(self):
+        """
+        Returns the current states of all sim worlds, one row per sim world.
+        """
+        return np.concatenate(self.call('get_current_state'))
+
+    def get_state_tuples(self, indexes):
+        """
+        Returns a list of the current states of the sim worlds with the
+        given indexes.
+        """
+        parts = [(range(size), ) for size in np.diff(
+            [*self.firsts, self.num_envs]).tolist()]
+        states = [
+            state for result in self.call('get_state_tuples', parts)
+            for state in result
+        ]
+        return [states[i] for i in indexes]
+
+    def get_legal_action_masks(self):
+        """
+        Returns a boolean array with one row per sim world marking the legal
+        actions in its current state.
+        """
+        return np.concatenate(self.call('get_legal_action_masks'))
+
+    def get_num_actions(self):
+        """
+        Returns the number of distinct actions of the sim worlds.
+        """
+        return self.num_actions
+
+    def get_rng_arrays(self, prefix, first=0):
+        """
+        Returns the states of the sim worlds' random streams as a dict of
+        arrays, as VectorSimWorld.get_rng_arrays.
+        """
+        arrays = {}
+        for result in self.call('get_rng_arrays', [
+            (prefix, first + worker_first) for worker_first in self.firsts
+        ]):
+            arrays.update(result)
+        return arrays
+
+    def set_rng_arrays(self, arrays, prefix, first=0):
+        """
+        Restores the sim worlds' random streams from arrays given by
+        get_rng_arrays.
+        """
+        self.call('set_rng_arrays', [(arrays, prefix, first + worker_first)
+                                     for worker_first in self.firsts])
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        for pipe in self.pipes:
+            pipe.send(('close', None))
+        for worker in self.workers:
+            worker.join()
+        self.pipes = []
+        self.workers = []
+
+
+def run_worker(pipe, make_sim_world, num_envs, seed):
+    """
+    Runs a worker of AsyncVectorSimWorld, stepping 'num_envs' sim worlds as
+    commanded through the pipe until told to close.
+    """
+    sim_world = VectorSimWorld(make_sim_world, num_envs, RandomStream(seed))
+    while True:
+        command, data = pipe.recv()
+        if command == 'close':
+            break
+        try:
+            if command == 'step':
+                # Also send the lengths of the episodes that ended
+                result = (*sim_world.step(data), sim_world.last_game_lengths)
+            else:
+                # Any other data is the arguments of the command
+                result = getattr(sim_world, command)(*(data or ()))
+        except Exception as error:  # pylint: disable=broad-except
+            result = error
+        pipe.send(result)
+    pipe.close()